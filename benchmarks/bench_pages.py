@@ -0,0 +1,286 @@
+"""
+Offline benchmark for the Home, News Visualizations and Bookmarks pages.
+
+Drives main.py through Streamlit's AppTest with every outbound call answered by
+the in-process stand-ins in benchmarks/stubs.py, and reports rerun latency,
+outbound calls per interaction and peak memory for each result size.
+
+Usage:
+    python -m benchmarks.bench_pages --sizes 10 100 1000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+from benchmarks.stubs import (
+    StubBackend,
+    install,
+    reset_enrichment_queue,
+    wait_for_enrichment,
+)
+
+
+def _button(at, label=None, key=None):
+    for button in at.button:
+        if (key is not None and button.key == key) or (
+            label is not None and button.label == label
+        ):
+            return button
+    return None
+
+
+def _load_home(at):
+    at.run()
+
+
+def _search(at):
+    at.text_input[0].input("climate")
+    _button(at, label="Search").click()
+    at.run()
+
+
+def _filter_sentiment(at):
+    at.selectbox[1].set_value("Positive")
+    at.run()
+
+
+def _show_more(at):
+    button = _button(at, label="Show More")
+    if button is None:
+        return False
+    button.click()
+    at.run()
+
+
+def _bookmark(at):
+    button = _button(at, key="bookmark_0")
+    if button is None:
+        return False
+    button.click()
+    at.run()
+
+
+def _open_dashboard(at):
+    at.sidebar.radio[0].set_value("News Visualizations")
+    at.run()
+
+
+def _open_bookmarks(at):
+    at.sidebar.radio[0].set_value("Bookmarks")
+    at.run()
+
+
+# one realistic session, in order; every step reruns the script once
+INTERACTIONS = [
+    ("load_home", _load_home),
+    ("search", _search),
+    ("filter_sentiment", _filter_sentiment),
+    ("show_more", _show_more),
+    ("bookmark", _bookmark),
+    ("open_dashboard", _open_dashboard),
+    ("open_bookmarks", _open_bookmarks),
+]
+
+
+def percentile(values, pct):
+    """
+    Returns the given percentile of a list of numbers, interpolating between ranks.
+
+    Args:
+        values (list): The samples.
+        pct (float): The percentile, between 0 and 100.
+
+    Returns:
+        float: The percentile value, or 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def run_session(backend, timeout):
+    """
+    Runs one simulated user session and records every interaction.
+
+    After each interaction the session waits for the enrichment workers to finish the
+    jobs it submitted, and records that time separately from the rerun itself.
+
+    Args:
+        backend (StubBackend): The backend answering outbound calls.
+        timeout (float): The AppTest timeout for a single rerun, in seconds.
+
+    Returns:
+        list: A list of (interaction, seconds, enrichment seconds, calls) tuples, where
+            calls is a Counter of outbound calls per service made during the interaction.
+    """
+    at = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=timeout)
+    results = []
+    for name, interaction in INTERACTIONS:
+        before = backend.snapshot_calls()
+        start = time.perf_counter()
+        if interaction(at) is False:
+            continue
+        elapsed = time.perf_counter() - start
+        if at.exception:
+            raise RuntimeError(f"{name} failed: {at.exception[0].message}")
+        enrichment = wait_for_enrichment(timeout)
+        results.append((name, elapsed, enrichment, backend.snapshot_calls() - before))
+    return results
+
+
+def shared_resources():
+    """
+    Returns the st.cache_resource functions whose cached objects hold page data.
+
+    The app modules read secrets when they are imported, so they are imported here, once
+    the stubs are installed.
+
+    Returns:
+        list: The cached functions.
+    """
+    from home import get_thumbnail_cache, get_trending_engine
+    from news_visualizations import (
+        get_inflation_data,
+        get_palestinian_death_toll_data,
+        get_presidential_approval_data,
+    )
+
+    return [
+        get_inflation_data,
+        get_presidential_approval_data,
+        get_palestinian_death_toll_data,
+        get_trending_engine,
+        get_thumbnail_cache,
+    ]
+
+
+def run_scenario(backend, size, repeat, timeout):
+    """
+    Benchmarks the session flow for a given number of articles.
+
+    The data caches, the shared resources that hold data (dashboard frames, trending engine,
+    thumbnail cache) and the enrichment queue are cleared first, so the first session is cold
+    and the following ones show the warm-cache behaviour.
+
+    Args:
+        backend (StubBackend): The backend answering outbound calls.
+        size (int): The number of articles returned by NewsAPI.
+        repeat (int): The number of sessions to run.
+        timeout (float): The AppTest timeout for a single rerun, in seconds.
+
+    Returns:
+        dict: The report for the scenario.
+    """
+    backend.configure(size)
+    st.cache_data.clear()
+    # not st.cache_resource.clear(): that would also drop the queue and the worker pool
+    for resource in shared_resources():
+        resource.clear()
+    reset_enrichment_queue()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    samples = {}
+    for _ in range(repeat):
+        for name, elapsed, enrichment, calls in run_session(backend, timeout):
+            samples.setdefault(name, []).append((elapsed, enrichment, calls))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    interactions = {}
+    for name, entries in samples.items():
+        latencies = [elapsed for elapsed, _, _ in entries]
+        enrichment = [waited for _, waited, _ in entries]
+        cold_calls = entries[0][2]
+        warm_calls = entries[-1][2]
+        interactions[name] = {
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "cold_ms": round(latencies[0] * 1000, 1),
+            "enrichment_p95_ms": round(percentile(enrichment, 95) * 1000, 1),
+            "cold_calls": dict(cold_calls),
+            "warm_calls": dict(warm_calls),
+        }
+    return {
+        "articles": size,
+        "sessions": repeat,
+        "peak_memory_mb": round(peak / 1024 / 1024, 1),
+        "interactions": interactions,
+    }
+
+
+def print_report(report):
+    print(
+        f"\n== {report['articles']} articles, {report['sessions']} sessions, "
+        f"peak memory {report['peak_memory_mb']} MB"
+    )
+    print(
+        f"{'interaction':<18}{'p50 ms':>10}{'p95 ms':>10}{'cold ms':>10}"
+        f"{'enrich p95':>12}  calls (cold / warm)"
+    )
+    for name, stats in report["interactions"].items():
+        cold = sum(stats["cold_calls"].values())
+        warm = sum(stats["warm_calls"].values())
+        print(
+            f"{name:<18}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['cold_ms']:>10}"
+            f"{stats['enrichment_p95_ms']:>12}  {cold} / {warm}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="multiply every stand-in latency by this factor (0 disables sleeping)",
+    )
+    parser.add_argument(
+        "--fixtures",
+        help="directory with recorded payloads to replay instead of generated ones",
+    )
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    backend = StubBackend(fixtures_dir=args.fixtures)
+    backend.latency = {
+        service: delay * args.latency_scale
+        for service, delay in backend.latency.items()
+    }
+
+    reports = []
+    with install(backend):
+        # import the pages up front so the first scenario does not pay for it
+        import main as app  # noqa: F401
+
+        for size in args.sizes:
+            report = run_scenario(backend, size, args.repeat, args.timeout)
+            print_report(report)
+            reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
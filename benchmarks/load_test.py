@@ -0,0 +1,315 @@
+"""
+Multi-session load test for the Streamlit app.
+
+Streamlit runs every session's script on its own thread inside one process and
+shares st.cache_data / st.cache_resource between them. This tool reproduces that
+by running N AppTest sessions concurrently in one process against the stand-ins
+in benchmarks/stubs.py, and reports throughput, tail latency, thread count, GIL
+contention, per-session memory growth and shared-cache hit rates.
+
+Usage:
+    python -m benchmarks.load_test --sessions 20 --duration 60
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import ExitStack, contextmanager, nullcontext
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from streamlit.runtime import Runtime
+from streamlit.testing.v1 import AppTest, app_test
+from streamlit.testing.v1.util import patch_config_options
+
+from benchmarks.bench_pages import INTERACTIONS, percentile
+from benchmarks.stubs import StubBackend, install
+import metrics
+
+
+class GilProbe(threading.Thread):
+    """
+    Measures how late a thread gets to run after a short sleep.
+
+    While other threads hold the GIL, the probe wakes up late; the lateness is a direct
+    measure of how long a ready thread waits for the interpreter.
+    """
+
+    def __init__(self, interval=0.005):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.delays = []
+        self.peak_threads = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            start = time.perf_counter()
+            time.sleep(self.interval)
+            self.delays.append(time.perf_counter() - start - self.interval)
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+@contextmanager
+def shared_runtime():
+    """
+    Lets concurrent AppTest sessions share one Runtime, as they would in a real server.
+
+    Every AppTest run installs a mock Runtime singleton and turns on the "global.appTest"
+    option, then removes both when it finishes, which breaks any other session that is
+    still running. Inside this block the last installed runtime stays visible and the
+    option stays on until the block exits.
+    """
+    last = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+        if not last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return last[0]
+
+    def exists(cls):
+        return cls._instance is not None or bool(last)
+
+    with ExitStack() as stack:
+        stack.enter_context(patch_config_options({"global.appTest": True}))
+        stack.enter_context(
+            mock.patch.object(
+                app_test, "patch_config_options", lambda options: nullcontext()
+            )
+        )
+        stack.enter_context(
+            mock.patch.object(Runtime, "instance", classmethod(instance))
+        )
+        stack.enter_context(mock.patch.object(Runtime, "exists", classmethod(exists)))
+        yield
+
+
+def _open_home(at):
+    at.sidebar.radio[0].set_value("Home")
+    at.run()
+
+
+def _session_worker(session_id, deadline, think_time, results, apps, timeout):
+    rng = random.Random(session_id)
+    at = AppTest.from_file(os.path.join(ROOT, "main.py"), default_timeout=timeout)
+    apps.append(at)
+    cpu_start = time.thread_time()
+    # the first pass loads Home; later passes come back to it from the Bookmarks page
+    flow = list(INTERACTIONS)
+    while time.monotonic() < deadline:
+        for name, interaction in flow:
+            if time.monotonic() >= deadline:
+                break
+            start = time.perf_counter()
+            try:
+                ran = interaction(at)
+                error = at.exception[0].message if at.exception else None
+            except Exception as e:
+                ran, error = True, repr(e)
+            elapsed = time.perf_counter() - start
+            if ran is not False:
+                results.append((session_id, name, elapsed, error))
+            if think_time:
+                time.sleep(rng.uniform(0, think_time))
+        flow = [("open_home", _open_home)] + list(INTERACTIONS[1:])
+    results.append((session_id, "_cpu", time.thread_time() - cpu_start, None))
+
+
+def _cache_counts(snapshot):
+    counts = {}
+    for counter in snapshot["counters"]:
+        if counter["name"] in ("cache_hits_total", "cache_misses_total"):
+            key = (counter["labels"].get("cache"), counter["name"])
+            counts[key] = counts.get(key, 0) + counter["value"]
+    return counts
+
+
+def run_load(backend, sessions, duration, think_time, timeout):
+    """
+    Runs the given number of concurrent sessions for a fixed duration.
+
+    Args:
+        backend (StubBackend): The backend answering outbound calls.
+        sessions (int): The number of concurrent sessions.
+        duration (float): How long to generate load for, in seconds.
+        think_time (float): The maximum pause between two interactions of a session, in seconds.
+        timeout (float): The AppTest timeout for a single rerun, in seconds.
+
+    Returns:
+        dict: The load test report.
+    """
+    results = []
+    apps = []
+    cache_before = _cache_counts(metrics.snapshot())
+    calls_before = backend.snapshot_calls()
+
+    tracemalloc.start()
+    memory_before, _ = tracemalloc.get_traced_memory()
+    probe = GilProbe()
+    probe.start()
+
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=_session_worker,
+            args=(i, deadline, think_time, results, apps, timeout),
+            name=f"session-{i}",
+        )
+        for i in range(sessions)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    probe.stop()
+    # the sessions are still referenced by `apps`, so their state is still counted
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    steps = [entry for entry in results if entry[1] != "_cpu"]
+    errors = [entry for entry in steps if entry[3]]
+    latencies = [entry[2] for entry in steps]
+    by_interaction = {}
+    for _, name, elapsed, _ in steps:
+        by_interaction.setdefault(name, []).append(elapsed)
+
+    cache_after = _cache_counts(metrics.snapshot())
+    caches = {}
+    for (cache, counter), value in cache_after.items():
+        delta = value - cache_before.get((cache, counter), 0)
+        caches.setdefault(cache, {"hits": 0, "misses": 0})
+        caches[cache]["hits" if counter == "cache_hits_total" else "misses"] = delta
+
+    calls = backend.snapshot_calls() - calls_before
+    return {
+        "sessions": sessions,
+        "duration_s": round(wall, 1),
+        "interactions": len(steps),
+        "errors": len(errors),
+        "first_error": f"{errors[0][1]}: {errors[0][3]}" if errors else None,
+        "throughput_per_s": round(len(steps) / wall, 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p95": round(percentile(latencies, 95) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+        },
+        "latency_p95_ms_by_interaction": {
+            name: round(percentile(values, 95) * 1000, 1)
+            for name, values in sorted(by_interaction.items())
+        },
+        "cpu_cores_used": round(cpu / wall, 2),
+        "gil_wait_ms": {
+            "mean": round(sum(probe.delays) / max(len(probe.delays), 1) * 1000, 2),
+            "p99": round(percentile(probe.delays, 99) * 1000, 2),
+            "max": round(max(probe.delays, default=0) * 1000, 2),
+        },
+        "peak_threads": probe.peak_threads,
+        "memory_mb": {
+            "growth": round((memory_after - memory_before) / 1024 / 1024, 1),
+            "growth_per_session": round(
+                (memory_after - memory_before) / sessions / 1024 / 1024, 2
+            ),
+            "peak": round((memory_peak - memory_before) / 1024 / 1024, 1),
+            "max_rss": round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+            ),
+        },
+        "outbound_calls": dict(calls),
+        "caches": caches,
+    }
+
+
+def print_report(report):
+    print(
+        f"\n== {report['sessions']} sessions for {report['duration_s']} s: "
+        f"{report['interactions']} interactions, {report['errors']} errors"
+    )
+    if report["first_error"]:
+        print(f"first error: {report['first_error']}")
+    print(f"throughput      {report['throughput_per_s']} interactions/s")
+    latency = report["latency_ms"]
+    print(
+        f"latency ms      p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}"
+    )
+    for name, value in report["latency_p95_ms_by_interaction"].items():
+        print(f"  p95 {name:<18}{value} ms")
+    gil = report["gil_wait_ms"]
+    print(
+        f"GIL wait ms     mean {gil['mean']}  p99 {gil['p99']}  max {gil['max']}"
+        f"  (cpu cores used {report['cpu_cores_used']})"
+    )
+    print(f"peak threads    {report['peak_threads']}")
+    memory = report["memory_mb"]
+    print(
+        f"memory MB       growth {memory['growth']}  per session {memory['growth_per_session']}"
+        f"  peak {memory['peak']}  max rss {memory['max_rss']}"
+    )
+    print(f"outbound calls  {report['outbound_calls']}")
+    for cache, counts in sorted(report["caches"].items()):
+        total = counts["hits"] + counts["misses"]
+        rate = counts["hits"] / total if total else 0
+        print(f"  cache {cache:<20}hit rate {rate:.0%} ({int(total)} lookups)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--articles", type=int, default=100)
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=1.0,
+        help="maximum pause between two interactions of a session, in seconds",
+    )
+    parser.add_argument("--latency-scale", type=float, default=1.0)
+    parser.add_argument("--fixtures")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--json", help="write the full report to this file")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    backend = StubBackend(article_count=args.articles, fixtures_dir=args.fixtures)
+    backend.latency = {
+        service: delay * args.latency_scale
+        for service, delay in backend.latency.items()
+    }
+
+    reports = []
+    with install(backend), shared_runtime():
+        import main as app  # noqa: F401
+
+        for sessions in args.sessions:
+            report = run_load(
+                backend, sessions, args.duration, args.think_time, args.timeout
+            )
+            print_report(report)
+            reports.append(report)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,552 @@
+import hashlib
+import io
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+from unittest import mock
+
+import pandas as pd
+import streamlit as st
+from PIL import Image
+from streamlit.runtime.secrets import Secrets
+
+# default latencies in seconds, roughly what the real services answer with
+DEFAULT_LATENCY = {
+    "newsapi": 0.25,
+    "openai": 0.8,
+    "firestore": 0.05,
+    "bls": 0.4,
+    "fivethirtyeight": 0.6,
+    "alphavantage": 0.3,
+    "hdx": 0.7,
+    "images": 0.3,
+}
+
+SECRETS = {
+    "NEWS_API_KEY": "bench",
+    "OPENAI_API_KEY": "bench",
+    "BLS_API_KEY": "bench",
+    "STOCKS_API_KEY": "bench",
+}
+
+_real_read_csv = pd.read_csv
+_real_getaddrinfo = socket.getaddrinfo
+_real_read_excel = pd.read_excel
+
+
+def _digest(text):
+    return int(hashlib.sha1(str(text).encode()).hexdigest(), 16)
+
+
+def make_articles(count, now=None):
+    """
+    Generates NewsAPI-shaped articles spread over the last month.
+
+    Args:
+        count (int): The number of articles to generate.
+        now (datetime): The reference time for the publish dates.
+
+    Returns:
+        list: A list of article dictionaries as returned by the NewsAPI "everything" endpoint.
+    """
+    now = now or datetime.now()
+    articles = []
+    for index in range(count):
+        published = now - timedelta(hours=index * 720 / max(count, 1))
+        articles.append(
+            {
+                "source": {"id": None, "name": f"Source {index % 17}"},
+                "author": f"Author {index % 23}",
+                "title": f"Headline {index}: markets, climate and elections update",
+                "description": f"Description of article {index}.",
+                "url": f"https://news.example.com/articles/{index}",
+                "urlToImage": f"https://images.example.com/{index}.jpg",
+                "publishedAt": published.strftime("%Y-%m-%dT%H:%M:%SZ"),
+                "content": f"Body of article {index}. " * 40,
+            }
+        )
+    return articles
+
+
+def make_headlines(count=100, now=None):
+    """
+    Generates NewsAPI-shaped top headlines from the last six hours, with a few stories
+    covered by several outlets in the last hour, so the trending engine has something
+    to rank.
+
+    Args:
+        count (int): The number of headlines to generate.
+        now (datetime): The reference time for the publish dates, in UTC.
+
+    Returns:
+        list: A list of article dictionaries as returned by the "top-headlines" endpoint.
+    """
+    now = now or datetime.now(timezone.utc)
+    stories = [
+        "Central bank holds interest rates as inflation cools",
+        "Hurricane makes landfall on the Gulf Coast",
+        "Senate passes stopgap funding bill",
+    ]
+    headlines = make_articles(count, now)
+    for index, article in enumerate(headlines):
+        if index % 3 == 0:
+            article["title"] = f"{stories[index % len(stories)]} - Source {index % 17}"
+            published = now - timedelta(minutes=index * 50 / count)
+        else:
+            published = now - timedelta(minutes=60 + index * 300 / count)
+        article["url"] = f"https://news.example.com/headlines/{index}"
+        article["publishedAt"] = published.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return headlines
+
+
+def make_bls_payload(months=36):
+    today = datetime.now()
+    data = []
+    for offset in range(months):
+        year = today.year - (offset + 1) // 12
+        month = (today.month - offset - 1) % 12 + 1
+        data.append(
+            {
+                "year": str(year),
+                "period": f"M{month:02d}",
+                "periodName": "",
+                "value": f"{300 + offset * 0.7:.3f}",
+            }
+        )
+    return {"status": "REQUEST_SUCCEEDED", "Results": {"series": [{"data": data}]}}
+
+
+def make_alphavantage_payload(days=100, symbol="AAPL"):
+    today = datetime.now().date()
+    base = 20 + _digest(symbol) % 400
+    series = {}
+    for offset in range(days):
+        day = today - timedelta(days=offset)
+        price = base + (offset % 11) - 5
+        series[day.isoformat()] = {
+            "1. open": f"{price:.2f}",
+            "2. high": f"{price + 2:.2f}",
+            "3. low": f"{price - 2:.2f}",
+            "4. close": f"{price + 1:.2f}",
+            "5. volume": str(50_000_000 + offset * 1000),
+        }
+    return {"Meta Data": {}, "Time Series (Daily)": series}
+
+
+def make_polls_csv(rows=5000):
+    lines = ["end_date,candidate_name,pct"]
+    start = datetime(2020, 1, 1)
+    names = ["Donald Trump", "Joe Biden", "Someone Else"]
+    for index in range(rows):
+        day = start + timedelta(days=index % 1600)
+        lines.append(f"{day.strftime('%m/%d/%y')},{names[index % 3]},{40 + index % 13}")
+    return "\n".join(lines)
+
+
+def make_gaza_frame(days=365):
+    start = datetime.now() - timedelta(days=days)
+    rows = []
+    for offset in range(days):
+        total = 100 + offset * 90
+        rows.append(
+            {
+                "date": (start + timedelta(days=offset)).strftime("%d-%b-%Y"),
+                "killed total": total,
+                "killed female": total // 4,
+                "killed male": total // 3,
+                "killed undefined": total - total // 4 - total // 3,
+            }
+        )
+    return pd.DataFrame(rows)
+
+
+class FakeResponse:
+    def __init__(self, payload=None, status_code=200, content=b""):
+        self._payload = payload
+        self.status_code = status_code
+        self.content = content
+        self.text = json.dumps(payload) if payload is not None else ""
+        self.headers = {"Content-Length": str(len(content))}
+        self.is_redirect = False
+
+    def json(self):
+        return self._payload
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.content), chunk_size):
+            yield self.content[start : start + chunk_size]
+
+    def close(self):
+        pass
+
+
+class StubBackend:
+    """
+    In-process stand-ins for NewsAPI, OpenAI, Firestore and the dashboard data sources.
+
+    Every outbound call sleeps for the configured latency of its service and is counted,
+    so a benchmark can report how many calls an interaction made.
+    """
+
+    def __init__(self, article_count=10, latency=None, fixtures_dir=None):
+        self.latency = dict(DEFAULT_LATENCY)
+        self.latency.update(latency or {})
+        self.fixtures_dir = fixtures_dir
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.bookmarks = []
+        self._image = None
+        self.configure(article_count)
+
+    def configure(self, article_count):
+        """
+        Resets the recorded calls and bookmarks and serves the given number of articles.
+
+        Args:
+            article_count (int): The number of articles returned by every NewsAPI query.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self.calls.clear()
+            self.bookmarks = []
+        recorded = self._load_fixture("newsapi.json")
+        if recorded is not None:
+            articles = json.loads(recorded)["articles"]
+            # repeat the recording until it is long enough
+            articles = (articles * (article_count // max(len(articles), 1) + 1))[
+                :article_count
+            ]
+        else:
+            articles = make_articles(article_count)
+        self.news_payload = {
+            "status": "ok",
+            "totalResults": len(articles),
+            "articles": articles,
+        }
+
+    def _load_fixture(self, name, mode="r"):
+        if not self.fixtures_dir:
+            return None
+        path = os.path.join(self.fixtures_dir, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, mode) as f:
+            return f.read()
+
+    def _hit(self, service):
+        with self._lock:
+            self.calls[service] += 1
+        delay = self.latency.get(service, 0)
+        if delay:
+            time.sleep(delay)
+
+    def snapshot_calls(self):
+        with self._lock:
+            return Counter(self.calls)
+
+    # HTTP
+
+    def requests_get(self, url, *args, **kwargs):
+        if "newsapi.org" in url:
+            self._hit("newsapi")
+            if "top-headlines" in url:
+                return FakeResponse(
+                    {"status": "ok", "totalResults": 100, "articles": make_headlines()}
+                )
+            return FakeResponse(self.news_payload)
+        if "api.bls.gov" in url:
+            self._hit("bls")
+            recorded = self._load_fixture("bls.json")
+            payload = json.loads(recorded) if recorded else make_bls_payload()
+            return FakeResponse(payload)
+        if "images.example.com" in url:
+            self._hit("images")
+            return FakeResponse(content=self.image_bytes())
+        if "alphavantage.co" in url:
+            self._hit("alphavantage")
+            recorded = self._load_fixture("alphavantage.json")
+            if recorded:
+                return FakeResponse(json.loads(recorded))
+            query = parse_qs(urlparse(url).query)
+            days = 1000 if query.get("outputsize") == ["full"] else 100
+            symbol = query.get("symbol", ["AAPL"])[0]
+            return FakeResponse(make_alphavantage_payload(days, symbol))
+        self._hit("other")
+        return FakeResponse(status_code=404, content=b"")
+
+    def getaddrinfo(self, host, port, *args, **kwargs):
+        # the fake hosts resolve to a public address, so the image URL check passes offline
+        if host.endswith(".example.com"):
+            return [
+                (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.215.14", port))
+            ]
+        return _real_getaddrinfo(host, port, *args, **kwargs)
+
+    def image_bytes(self):
+        # a publisher-sized photo; noise keeps it from compressing unrealistically well
+        with self._lock:
+            if self._image is not None:
+                return self._image
+            bands = [
+                Image.effect_noise((1600, 900), 32 + 16 * band) for band in range(3)
+            ]
+            image = Image.merge("RGB", bands)
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=90)
+            self._image = output.getvalue()
+        return self._image
+
+    def read_csv(self, source, *args, **kwargs):
+        if isinstance(source, str) and "fivethirtyeight.com" in source:
+            self._hit("fivethirtyeight")
+            recorded = self._load_fixture("president_polls.csv")
+            return _real_read_csv(
+                io.StringIO(recorded or make_polls_csv()), *args, **kwargs
+            )
+        return _real_read_csv(source, *args, **kwargs)
+
+    def read_excel(self, source, *args, **kwargs):
+        if isinstance(source, str) and "humdata.org" in source:
+            self._hit("hdx")
+            recorded = self._load_fixture("gaza.xlsx", mode="rb")
+            if recorded is not None:
+                return _real_read_excel(io.BytesIO(recorded), *args, **kwargs)
+            return make_gaza_frame()
+        return _real_read_excel(source, *args, **kwargs)
+
+    # OpenAI
+
+    def chat_completion(self, model, messages, **kwargs):
+        self._hit("openai")
+        prompt = messages[0]["content"].lower()
+        text = messages[-1]["content"] or ""
+        if "sentiment" in prompt:
+            content = ["Positive", "Neutral", "Negative"][_digest(text) % 3]
+        elif "key phrases" in prompt:
+            content = "\n".join(f"phrase {i}" for i in range(5))
+        else:
+            content = f"Summary of: {text[:80]}"
+        usage = SimpleNamespace(
+            prompt_tokens=len(text) // 4 + 40,
+            completion_tokens=len(content) // 4 + 1,
+            total_tokens=len(text) // 4 + len(content) // 4 + 41,
+        )
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(
+            model=model, choices=[SimpleNamespace(message=message)], usage=usage
+        )
+
+    def embedding(self, model, input, dimensions=256, **kwargs):
+        self._hit("openai")
+        # hashed bag of words, so articles that share words come out as similar
+        vector = [0.0] * dimensions
+        words = input.lower().split()
+        for word in words:
+            vector[_digest(word) % dimensions] += 1.0
+        usage = SimpleNamespace(prompt_tokens=len(words), total_tokens=len(words))
+        return SimpleNamespace(
+            model=model, data=[SimpleNamespace(embedding=vector)], usage=usage
+        )
+
+
+class FakeOpenAI:
+    def __init__(self, backend):
+        create = backend.chat_completion
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=create))
+        self.embeddings = SimpleNamespace(create=backend.embedding)
+
+
+class _FakeDocument:
+    def __init__(self, data):
+        self._data = data
+
+    def get(self, key):
+        return self._data.get(key)
+
+
+class _FakeQuery:
+    def __init__(self, backend, filters=(), order=None, limit=None):
+        self._backend = backend
+        self._filters = filters
+        self._order = order
+        self._limit = limit
+
+    def where(self, field, op, value):
+        return _FakeQuery(
+            self._backend, self._filters + ((field, value),), self._order, self._limit
+        )
+
+    def order_by(self, field, direction="ASCENDING"):
+        return _FakeQuery(self._backend, self._filters, (field, direction), self._limit)
+
+    def limit(self, count):
+        return _FakeQuery(self._backend, self._filters, self._order, count)
+
+    def stream(self):
+        backend = self._backend
+        backend._hit("firestore")
+        with backend._lock:
+            rows = [
+                row
+                for row in backend.bookmarks
+                if all(row.get(field) == value for field, value in self._filters)
+            ]
+        if self._order:
+            field, direction = self._order
+            rows.sort(key=lambda row: row[field], reverse=direction == "DESCENDING")
+        if self._limit is not None:
+            rows = rows[: self._limit]
+        return iter([_FakeDocument(row) for row in rows])
+
+
+class _FakeDocumentRef:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def set(self, data):
+        self._backend._hit("firestore")
+        with self._backend._lock:
+            self._backend.bookmarks.append(dict(data))
+
+
+class _FakeCollection(_FakeQuery):
+    def document(self):
+        return _FakeDocumentRef(self._backend)
+
+
+class FakeFirestore:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def collection(self, name):
+        return _FakeCollection(self._backend)
+
+
+def reset_enrichment_queue():
+    """
+    Deletes every job from the enrichment queue and empties the embedding index, the
+    thumbnail cache and the market data store, so the next scenario starts cold.
+
+    Returns:
+        None
+    """
+    with sqlite3.connect(os.environ["ENRICHMENT_DB"]) as conn:
+        conn.execute("DELETE FROM jobs")
+    index_db = os.path.join(os.environ["EMBEDDINGS_DIR"], "ids.sqlite3")
+    if os.path.exists(index_db):
+        with sqlite3.connect(index_db) as conn:
+            conn.execute("DELETE FROM articles")
+    for directory in (os.environ["THUMBNAIL_DIR"], os.environ["MARKET_DIR"]):
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+
+
+def wait_for_enrichment(timeout=600, poll_seconds=0.05):
+    """
+    Waits until the enrichment queue has no queued or running jobs.
+
+    Args:
+        timeout (float): The maximum time to wait, in seconds.
+        poll_seconds (float): How often to check the queue.
+
+    Returns:
+        float: The time waited, in seconds.
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+    with sqlite3.connect(os.environ["ENRICHMENT_DB"]) as conn:
+        while time.perf_counter() < deadline:
+            (pending,) = conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchone()
+            if not pending:
+                break
+            time.sleep(poll_seconds)
+    return time.perf_counter() - start
+
+
+@contextmanager
+def install(backend, workers=4):
+    """
+    Routes every outbound call of the app to the given backend for the duration of the block.
+
+    The API keys are replaced with dummy secrets, so no secrets.toml is needed. Modules that
+    bind their clients at import time (utils.client, utils.db) are re-pointed as well.
+
+    The enrichment queue, the embedding index, the thumbnail cache and the market data
+    store are moved to a temporary directory, and the queue is served by worker threads
+    in this process instead of the separate worker pool, so they see the stubbed OpenAI
+    client.
+
+    Args:
+        backend (StubBackend): The backend that answers the calls.
+        workers (int): The number of enrichment worker threads.
+    """
+    fake_openai = FakeOpenAI(backend)
+    fake_db = FakeFirestore(backend)
+    secrets = Secrets()
+    secrets._secrets = dict(SECRETS)
+    with ExitStack() as stack:
+        queue_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        stack.enter_context(
+            mock.patch.dict(
+                os.environ,
+                {
+                    "ENRICHMENT_DB": os.path.join(queue_dir, "enrichment.sqlite3"),
+                    "ENRICHMENT_WORKERS": "0",
+                    "EMBEDDINGS_DIR": os.path.join(queue_dir, "embeddings"),
+                    "THUMBNAIL_DIR": os.path.join(queue_dir, "thumbnails"),
+                    "MARKET_DIR": os.path.join(queue_dir, "market"),
+                    # the stand-in has no rate limit; keep the scheduler from waiting on one
+                    "ALPHAVANTAGE_CALLS_PER_MINUTE": "6000",
+                    "ALPHAVANTAGE_CALLS_PER_DAY": "1000000",
+                },
+            )
+        )
+        stack.enter_context(mock.patch.object(st, "secrets", secrets))
+        stack.enter_context(mock.patch("requests.get", backend.requests_get))
+        stack.enter_context(mock.patch("socket.getaddrinfo", backend.getaddrinfo))
+        stack.enter_context(mock.patch("pandas.read_csv", backend.read_csv))
+        stack.enter_context(mock.patch("pandas.read_excel", backend.read_excel))
+        stack.enter_context(mock.patch("openai.OpenAI", lambda **kwargs: fake_openai))
+        stack.enter_context(
+            mock.patch("firebase_config.initialize_firebase", lambda: fake_db)
+        )
+        import utils
+
+        stack.enter_context(mock.patch.object(utils, "client", fake_openai))
+        stack.enter_context(mock.patch.object(utils, "db", fake_db))
+
+        from enrichment_queue import JobQueue
+        from enrichment_worker import run_worker
+
+        queue = JobQueue()
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=run_worker,
+                args=(f"bench-{index}", stop, queue, 0.02),
+                daemon=True,
+            )
+            for index in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            yield backend
+        finally:
+            stop.set()
+            for thread in threads:
+                thread.join()
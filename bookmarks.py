@@ -1,12 +1,7 @@
 import streamlit as st
-from utils import (
-    get_ai_summary,
-    get_sentiment_analysis,
-    get_key_phrases,
-    fetch_bookmarked_articles,
-    sentiment_box,
-    key_phrase_box,
-)
+from utils import fetch_bookmarked_articles
+from enrichment_queue import request_enrichment, render_enrichment, poll_for_results
+from metrics import timed
 
 
 # Load CSS file
@@ -15,22 +10,6 @@ def local_css(file_name):
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
 
-# Cache OpenAI results to avoid repeated calls
-@st.cache_data(show_spinner=False, ttl=600)
-def cache_openai_summary(text):
-    return get_ai_summary(text)
-
-
-@st.cache_data(show_spinner=False, ttl=600)
-def cache_openai_sentiment(text):
-    return get_sentiment_analysis(text)
-
-
-@st.cache_data(show_spinner=False, ttl=600)
-def cache_openai_key_phrases(text):
-    return get_key_phrases(text)
-
-
 def display_bookmarked_articles():
     local_css("styles/styles.css")
     st.markdown(
@@ -38,6 +17,7 @@ def display_bookmarked_articles():
     )
 
     articles = fetch_bookmarked_articles()
+    pending_jobs = set()
 
     for index, article in enumerate(articles):
         st.subheader(article["title"])
@@ -51,19 +31,17 @@ def display_bookmarked_articles():
         content = (
             f"Content of the article titled '{article['title']}'"  # Placeholder content
         )
-        summary = cache_openai_summary(content)
-        st.write(f"**Summary:** {summary}")
-
-        sentiment = cache_openai_sentiment(content)
-        st.markdown(sentiment_box(sentiment), unsafe_allow_html=True)
-
-        key_phrases = cache_openai_key_phrases(content)
-        key_phrases_list = key_phrases.split(", ")
-        st.write(f"**Key Phrases**")
-        st.markdown(key_phrase_box(key_phrases_list), unsafe_allow_html=True)
+        with timed("enrich.request"):
+            results, pending = request_enrichment(content)
+        render_enrichment(results, pending)
+        pending_jobs.update(pending)
 
         st.markdown("---")
 
+    # refresh the page when the enrichment workers finish a pending job
+    if pending_jobs:
+        poll_for_results(sorted(pending_jobs))
+
 
 if __name__ == "__main__":
     display_bookmarked_articles()
@@ -0,0 +1,512 @@
+import fcntl
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+import numpy as np
+import streamlit as st
+from enrichment_queue import get_queue
+from metrics import increment, timed
+
+# default location of the index; override with the EMBEDDINGS_DIR environment variable
+INDEX_DIR = ".cache/embeddings"
+
+EMBEDDING_MODEL = "text-embedding-3-small"
+# shortened embeddings keep a 100k-article matrix at 100 MB and a full scan at a few ms
+DIMENSIONS = 256
+
+# the matrix file grows by at least this many rows at a time
+GROW_ROWS = 4096
+
+# above this many rows, queries only scan the closest IVF partitions
+IVF_THRESHOLD = 50_000
+# enough partitions are scanned to find this share of the true top-k, measured at build time
+IVF_TARGET_RECALL = 0.95
+IVF_CALIBRATION_QUERIES = 200
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS articles (
+    row INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL UNIQUE,
+    title TEXT,
+    url TEXT,
+    source TEXT,
+    published_at TEXT,
+    image TEXT,
+    text TEXT
+);
+"""
+
+
+def content_hash(text):
+    """
+    Returns the hash that identifies an article's text in the index.
+
+    Args:
+        text (str): The article text.
+
+    Returns:
+        str: The hex digest of the text.
+    """
+    return hashlib.sha256((text or "").encode()).hexdigest()
+
+
+def article_payload(article):
+    """
+    Serialises the fields of a NewsAPI article that the index stores.
+
+    Args:
+        article (dict): A NewsAPI article.
+
+    Returns:
+        str: A JSON payload for an "embedding" job.
+    """
+    return json.dumps(
+        {
+            "text": article.get("content") or article.get("description") or "",
+            "title": article.get("title"),
+            "url": article.get("url"),
+            "source": (article.get("source") or {}).get("name"),
+            "published_at": article.get("publishedAt"),
+            "image": article.get("urlToImage"),
+        },
+        sort_keys=True,
+    )
+
+
+class EmbeddingIndex:
+    """
+    Article embeddings in a memory-mapped float32 matrix, with a SQLite map from row to
+    content hash and article fields.
+
+    Vectors are L2-normalised, so cosine similarity is a dot product. Any number of
+    processes can read the index; writers serialise on a file lock. A row is only listed
+    in SQLite after its vector has been written, so readers never see a partial row.
+    """
+
+    def __init__(self, directory=None, dimensions=DIMENSIONS):
+        self.directory = directory or os.environ.get("EMBEDDINGS_DIR", INDEX_DIR)
+        self.dimensions = dimensions
+        os.makedirs(self.directory, exist_ok=True)
+        self.matrix_path = os.path.join(self.directory, "vectors.f32")
+        self.lock_path = os.path.join(self.directory, "write.lock")
+        self._local = threading.local()
+        self._matrix = None
+        self._matrix_lock = threading.Lock()
+        self._ivf = None
+        self._ivf_building = False
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                os.path.join(self.directory, "ids.sqlite3"), timeout=30
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        (count,) = self._connect().execute("SELECT COUNT(*) FROM articles").fetchone()
+        return count
+
+    def row_of(self, hash_):
+        row = (
+            self._connect()
+            .execute("SELECT row FROM articles WHERE hash = ?", (hash_,))
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def missing(self, hashes):
+        """
+        Returns which of the given content hashes are not in the index yet.
+
+        Args:
+            hashes (list): A list of content hashes.
+
+        Returns:
+            set: The hashes that have no row.
+        """
+        if not hashes:
+            return set()
+        found = self._connect().execute(
+            f"SELECT hash FROM articles WHERE hash IN ({','.join('?' * len(hashes))})",
+            list(hashes),
+        )
+        return set(hashes) - {row[0] for row in found}
+
+    def add(self, hash_, vector, fields):
+        """
+        Appends a vector to the index, unless the content hash is already present.
+
+        Args:
+            hash_ (str): The content hash of the article text.
+            vector (list): The embedding of the text.
+            fields (dict): The article fields from article_payload().
+
+        Returns:
+            int: The row of the vector.
+        """
+        vector = np.array(vector, dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        with open(self.lock_path, "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            existing = self.row_of(hash_)
+            if existing is not None:
+                return existing
+            row = len(self)
+            capacity = self._capacity()
+            if row >= capacity:
+                with open(self.matrix_path, "ab") as f:
+                    f.truncate(
+                        max(capacity * 2, capacity + GROW_ROWS) * self.dimensions * 4
+                    )
+            matrix = np.memmap(
+                self.matrix_path,
+                dtype=np.float32,
+                mode="r+",
+                shape=(row + 1, self.dimensions),
+            )
+            matrix[row] = vector
+            matrix.flush()
+            del matrix
+            conn = self._connect()
+            with conn:
+                conn.execute(
+                    "INSERT INTO articles (row, hash, title, url, source, published_at, image, text)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        row,
+                        hash_,
+                        fields.get("title"),
+                        fields.get("url"),
+                        fields.get("source"),
+                        fields.get("published_at"),
+                        fields.get("image"),
+                        fields.get("text"),
+                    ),
+                )
+        return row
+
+    def _capacity(self):
+        if not os.path.exists(self.matrix_path):
+            return 0
+        return os.path.getsize(self.matrix_path) // (self.dimensions * 4)
+
+    def matrix(self):
+        """
+        Returns a read-only view of the stored vectors, remapping the file when it has grown.
+
+        Returns:
+            numpy.ndarray: An (n, DIMENSIONS) float32 array.
+        """
+        count = len(self)
+        with self._matrix_lock:
+            if self._matrix is None or self._matrix.shape[0] < count:
+                capacity = self._capacity()
+                if capacity == 0:
+                    return np.empty((0, self.dimensions), dtype=np.float32)
+                self._matrix = np.memmap(
+                    self.matrix_path,
+                    dtype=np.float32,
+                    mode="r",
+                    shape=(capacity, self.dimensions),
+                )
+            return self._matrix[:count]
+
+    def search(self, vector, k=10, exclude=None):
+        """
+        Returns the rows most similar to a vector by cosine similarity.
+
+        Small indexes are scanned in full with one matrix-vector product. Once the index
+        has IVF_THRESHOLD rows, only the closest IVF partitions are scanned, plus any rows
+        added since the partitions were built. The partitions are built in a background
+        thread; until they are ready, queries scan the full matrix.
+
+        Args:
+            vector (list): The query embedding.
+            k (int): The number of results.
+            exclude (int): A row to leave out, e.g. the query article itself.
+
+        Returns:
+            list: A list of (row, score) tuples, most similar first.
+        """
+        matrix = self.matrix()
+        if not len(matrix):
+            return []
+        query = np.array(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+
+        candidates = None
+        if len(matrix) >= IVF_THRESHOLD:
+            candidates = self._ivf_candidates(matrix, query)
+        if candidates is None:
+            scores = matrix @ query
+            rows = np.arange(len(matrix))
+        else:
+            scores = matrix[candidates] @ query
+            rows = candidates
+
+        if exclude is not None:
+            scores = np.where(rows == exclude, -np.inf, scores)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(int(rows[i]), float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def _ivf_candidates(self, matrix, query):
+        with self._matrix_lock:
+            ivf = self._ivf
+            # rebuild once the index has grown by a quarter since the last build; the old
+            # partitions plus a full scan of the new rows are used in the meantime
+            if (ivf is None or len(matrix) > ivf[2] * 1.25) and not self._ivf_building:
+                self._ivf_building = True
+                threading.Thread(
+                    target=self._rebuild_ivf, args=(matrix,), daemon=True
+                ).start()
+        if ivf is None or ivf[3] is None:
+            return None
+        centroids, lists, built, probes = ivf
+        nearest = np.argpartition(-(centroids @ query), probes - 1)[:probes]
+        tail = np.arange(built, len(matrix))
+        return np.concatenate([lists[i] for i in nearest] + [tail])
+
+    def _rebuild_ivf(self, matrix):
+        try:
+            with timed("embeddings.build_ivf"):
+                ivf = self._build_ivf(matrix)
+            with self._matrix_lock:
+                self._ivf = ivf
+        finally:
+            with self._matrix_lock:
+                self._ivf_building = False
+
+    def _build_ivf(self, matrix, iterations=8, seed=0, k=10):
+        # spherical k-means on a sample, then assign every row to its closest centroid
+        count = len(matrix)
+        partitions = int(np.sqrt(count))
+        rng = np.random.default_rng(seed)
+        sample = np.asarray(
+            matrix[
+                np.sort(rng.choice(count, min(count, partitions * 40), replace=False))
+            ]
+        )
+        centroids = sample[rng.choice(len(sample), partitions, replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids)
+
+        assignment = np.empty(count, dtype=np.int32)
+        for start in range(0, count, 65536):
+            block = np.asarray(matrix[start : start + 65536])
+            assignment[start : start + len(block)] = np.argmax(
+                block @ centroids.T, axis=1
+            )
+        order = np.argsort(assignment, kind="stable")
+        bounds = np.searchsorted(assignment[order], np.arange(partitions + 1))
+        lists = [order[bounds[i] : bounds[i + 1]] for i in range(partitions)]
+        probes = self._calibrate_probes(matrix, centroids, assignment, rng, k)
+        return centroids, lists, count, probes
+
+    def _calibrate_probes(self, matrix, centroids, assignment, rng, k):
+        # exact top-k of sampled rows, found by a full scan, leaving out the row itself
+        count = len(matrix)
+        rows = np.sort(
+            rng.choice(count, min(count, IVF_CALIBRATION_QUERIES), replace=False)
+        )
+        queries = np.asarray(matrix[rows])
+        # half of them are blends of two rows, which sit between clusters like a typed
+        # search query does, rather than on top of a stored vector
+        half = len(rows) // 2
+        queries[:half] += np.asarray(matrix[np.sort(rng.choice(count, half))])
+        queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, 65536):
+            block = np.asarray(matrix[start : start + 65536])
+            scores[:, start : start + len(block)] = queries @ block.T
+        scores[np.arange(len(rows)), rows] = -np.inf
+        neighbours = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        del scores
+
+        # a neighbour is found with p probes when its partition is among the query's p
+        # closest centroids, so the recall of every probe count comes from these ranks
+        centroid_rank = np.argsort(np.argsort(-(queries @ centroids.T), axis=1), axis=1)
+        ranks = np.take_along_axis(centroid_rank, assignment[neighbours], axis=1)
+        found = np.bincount(ranks.ravel(), minlength=len(centroids)).cumsum()
+        probes = int(np.searchsorted(found, IVF_TARGET_RECALL * ranks.size)) + 1
+        # past half the partitions a full scan is about as fast and exact
+        return probes if probes <= len(centroids) // 2 else None
+
+    def articles(self, rows):
+        """
+        Returns the stored articles for the given rows, in NewsAPI shape.
+
+        Args:
+            rows (list): A list of row numbers.
+
+        Returns:
+            list: A list of article dictionaries, in the order of the rows.
+        """
+        if not rows:
+            return []
+        placeholders = ",".join("?" * len(rows))
+        found = {
+            row[0]: {
+                "title": row[1],
+                "url": row[2],
+                "source": {"name": row[3]},
+                "publishedAt": row[4],
+                "urlToImage": row[5],
+                "content": row[6],
+                "description": row[6],
+            }
+            for row in self._connect().execute(
+                "SELECT row, title, url, source, published_at, image, text FROM articles"
+                f" WHERE row IN ({placeholders})",
+                list(rows),
+            )
+        }
+        return [found[row] for row in rows if row in found]
+
+    def related(self, text, k=3):
+        """
+        Returns the articles most similar to an indexed article.
+
+        Args:
+            text (str): The text of the article.
+            k (int): The number of related articles.
+
+        Returns:
+            list: A list of article dictionaries, or an empty list if the article is not
+                indexed yet.
+        """
+        row = self.row_of(content_hash(text))
+        if row is None:
+            return []
+        matrix = self.matrix()
+        if row >= len(matrix):
+            return []
+        results = self.search(matrix[row], k, exclude=row)
+        return self.articles([result_row for result_row, _ in results])
+
+
+def index_article(payload):
+    """
+    Embeds an article and adds it to the index. Runs in the enrichment workers.
+
+    Args:
+        payload (str): The JSON payload from article_payload().
+
+    Returns:
+        str: The row of the article in the index.
+    """
+    # imported here: utils sets up the OpenAI and Firestore clients on import
+    from utils import get_embedding
+
+    fields = json.loads(payload)
+    index = EmbeddingIndex()
+    hash_ = content_hash(fields["text"])
+    row = index.row_of(hash_)
+    if row is None:
+        vector = get_embedding(fields["text"], EMBEDDING_MODEL, index.dimensions)
+        row = index.add(hash_, vector, fields)
+    return str(row)
+
+
+@st.cache_resource(show_spinner=False)
+def get_index():
+    """
+    Returns the embedding index shared by every session of this process.
+
+    Returns:
+        EmbeddingIndex: The embedding index.
+    """
+    return EmbeddingIndex()
+
+
+def index_articles(articles):
+    """
+    Submits "embedding" jobs for the articles that are not in the index yet.
+
+    Args:
+        articles (list): A list of NewsAPI articles.
+
+    Returns:
+        int: The number of articles that were submitted.
+    """
+    payloads = {}
+    for article in articles:
+        payload = article_payload(article)
+        text = json.loads(payload)["text"]
+        if text:
+            payloads[content_hash(text)] = payload
+    missing = get_index().missing(list(payloads))
+    increment("cache_hits_total", len(payloads) - len(missing), cache="embeddings")
+    increment("cache_misses_total", len(missing), cache="embeddings")
+    if missing:
+        get_queue().submit_many([("embedding", payloads[hash_]) for hash_ in missing])
+    return len(missing)
+
+
+@st.cache_data(show_spinner=False, ttl=3600)
+def embed_query(query):
+    """
+    Computes the embedding of a search query.
+
+    Args:
+        query (str): The search query.
+
+    Returns:
+        list: The embedding of the query.
+    """
+    # imported here: utils sets up the OpenAI and Firestore clients on import
+    from utils import get_embedding
+
+    return get_embedding(query, EMBEDDING_MODEL, DIMENSIONS)
+
+
+def semantic_search(query, k=20):
+    """
+    Returns the indexed articles closest in meaning to a search query.
+
+    Args:
+        query (str): The search query.
+        k (int): The maximum number of articles.
+
+    Returns:
+        list: A list of article dictionaries, closest first.
+    """
+    vector = embed_query(query)
+    index = get_index()
+    with timed("embeddings.search"):
+        rows = [row for row, _ in index.search(vector, k)]
+    return index.articles(rows)
+
+
+def render_related(text, k=3):
+    """
+    Renders links to the indexed articles most similar to an article, if there are any.
+
+    Args:
+        text (str): The text of the article.
+        k (int): The number of related articles.
+
+    Returns:
+        None
+    """
+    with timed("embeddings.related"):
+        related = get_index().related(text, k)
+    if not related:
+        return
+    with st.expander("Related articles"):
+        for article in related:
+            st.markdown(
+                f"- [{article['title']}]({article['url']}) ({article['source']['name']})"
+            )
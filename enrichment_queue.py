@@ -0,0 +1,497 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import streamlit as st
+from metrics import increment, register_collector
+
+# default location of the queue; override with the ENRICHMENT_DB environment variable
+DB_PATH = ".cache/enrichment.sqlite3"
+
+# kinds of enrichment shown on every card; the workers also run "embedding" jobs (embeddings.py)
+KINDS = ["summary", "sentiment", "key_phrases"]
+
+# how long a worker may hold a job before another worker can take it over
+LEASE_SECONDS = 120
+MAX_ATTEMPTS = 3
+
+# failed jobs are submitted again once they are this old
+RETRY_FAILED_SECONDS = 600
+
+# how often the page checks for finished jobs
+POLL_SECONDS = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, priority DESC, created_at);
+CREATE TABLE IF NOT EXISTS worker_counters (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+);
+CREATE TABLE IF NOT EXISTS worker_timings (
+    span TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    total REAL NOT NULL,
+    longest REAL NOT NULL
+);
+"""
+
+
+def job_id(kind, payload):
+    """
+    Returns the ID of the job for a kind of enrichment and its input text.
+
+    The same text always maps to the same job, so a result is computed and paid for once.
+
+    Args:
+        kind (str): The kind of enrichment, one of KINDS.
+        payload (str): The text to enrich.
+
+    Returns:
+        str: The job ID.
+    """
+    return hashlib.sha256(f"{kind}\0{payload}".encode()).hexdigest()
+
+
+class JobQueue:
+    """
+    Durable enrichment job queue stored in SQLite.
+
+    Jobs are keyed by their kind and input text and keep their result after completion,
+    so finished work survives reruns and restarts. Connections are kept per thread.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.environ.get("ENRICHMENT_DB", DB_PATH)
+        self._local = threading.local()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(_SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _read(self):
+        return _Transaction(self._connect(), "BEGIN")
+
+    def _write(self):
+        # take the write lock up front, so concurrent writers wait instead of failing
+        return _Transaction(self._connect(), "BEGIN IMMEDIATE")
+
+    def submit(self, kind, payload, priority=0):
+        """
+        Submits an enrichment job and returns its current result.
+
+        Args:
+            kind (str): The kind of enrichment, one of KINDS.
+            payload (str): The text to enrich.
+            priority (int): Jobs with a higher priority are claimed first.
+
+        Returns:
+            tuple: (job ID, result or None if the job has not finished, True if the job is new).
+        """
+        ids, results, created = self.submit_many([(kind, payload)], priority)
+        return ids[0], results[ids[0]], created[0]
+
+    def submit_many(self, jobs, priority=0):
+        """
+        Submits several enrichment jobs in one transaction and returns their current results.
+
+        Jobs that already exist are not submitted again, but a queued job is moved up if it
+        is submitted with a higher priority. Failed jobs are re-queued once they are older
+        than RETRY_FAILED_SECONDS.
+
+        Args:
+            jobs (list): A list of (kind, payload) tuples.
+            priority (int): Jobs with a higher priority are claimed first.
+
+        Returns:
+            tuple: (list of job IDs, dict of job ID to result or None, list of booleans that
+                are True for jobs that were newly created).
+        """
+        now = time.time()
+        ids = [job_id(kind, payload) for kind, payload in jobs]
+        created = []
+        with self._write() as conn:
+            for id_, (kind, payload) in zip(ids, jobs):
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO jobs"
+                    " (id, kind, payload, status, priority, created_at, updated_at)"
+                    " VALUES (?, ?, ?, 'queued', ?, ?, ?)",
+                    (id_, kind, payload, priority, now, now),
+                )
+                created.append(cursor.rowcount == 1)
+            placeholders = ",".join("?" * len(ids))
+            conn.execute(
+                f"UPDATE jobs SET priority = ? WHERE status = 'queued' AND priority < ?"
+                f" AND id IN ({placeholders})",
+                (priority, priority, *ids),
+            )
+            conn.execute(
+                f"UPDATE jobs SET status = 'queued', attempts = 0, updated_at = ?"
+                f" WHERE status = 'failed' AND updated_at < ?"
+                f" AND id IN ({placeholders})",
+                (now, now - RETRY_FAILED_SECONDS, *ids),
+            )
+        return ids, self.results(ids), created
+
+    def results(self, ids):
+        """
+        Returns the results of the given jobs.
+
+        Args:
+            ids (list): A list of job IDs.
+
+        Returns:
+            dict: A dictionary of job ID to result, or None for jobs that have not finished.
+        """
+        if not ids:
+            return {}
+        with self._read() as conn:
+            rows = conn.execute(
+                f"SELECT id, result FROM jobs WHERE status = 'done'"
+                f" AND id IN ({','.join('?' * len(ids))})",
+                list(ids),
+            ).fetchall()
+        results = dict.fromkeys(ids)
+        results.update(rows)
+        return results
+
+    def pending(self, ids):
+        """
+        Returns which of the given jobs are still queued or running.
+
+        Args:
+            ids (list): A list of job IDs.
+
+        Returns:
+            set: The IDs of the jobs that have not finished or failed yet.
+        """
+        if not ids:
+            return set()
+        with self._read() as conn:
+            rows = conn.execute(
+                f"SELECT id FROM jobs WHERE status IN ('queued', 'running')"
+                f" AND id IN ({','.join('?' * len(ids))})",
+                list(ids),
+            ).fetchall()
+        return {row[0] for row in rows}
+
+    def claim(self, worker):
+        """
+        Claims the oldest queued job, or a running job whose lease has expired.
+
+        Running jobs whose lease expired after MAX_ATTEMPTS attempts are marked failed.
+
+        Args:
+            worker (str): The name of the claiming worker, for debugging.
+
+        Returns:
+            tuple: (job ID, kind, payload), or None if there is nothing to do.
+        """
+        now = time.time()
+        with self._write() as conn:
+            # a job whose worker died on every attempt is given up instead of retried forever
+            exhausted = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'lease expired', lease_until = NULL,"
+                " updated_at = ? WHERE status = 'running' AND lease_until < ? AND attempts >= ?"
+                " RETURNING kind",
+                (now, now, MAX_ATTEMPTS),
+            ).fetchall()
+            row = conn.execute(
+                "SELECT id, kind, payload FROM jobs"
+                " WHERE status = 'queued' OR (status = 'running' AND lease_until < ?)"
+                " ORDER BY priority DESC, created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is not None:
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1,"
+                    " lease_until = ?, error = ?, updated_at = ? WHERE id = ?",
+                    (now + LEASE_SECONDS, f"claimed by {worker}", now, row[0]),
+                )
+        for (kind,) in exhausted:
+            increment("enrichment_failures_total", kind=kind, outcome="gave_up")
+        return row
+
+    def complete(self, id_, worker, result):
+        """
+        Stores the result of a job, if the worker still holds it.
+
+        Args:
+            id_ (str): The job ID.
+            worker (str): The name the job was claimed with.
+            result (str): The result of the job.
+
+        Returns:
+            bool: False if the lease expired and the job was claimed again.
+        """
+        with self._write() as conn:
+            updated = conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL,"
+                " lease_until = NULL, updated_at = ?"
+                " WHERE id = ? AND status = 'running' AND error = ?",
+                (result, time.time(), id_, f"claimed by {worker}"),
+            ).rowcount
+        return bool(updated)
+
+    def fail(self, id_, worker, error):
+        """
+        Records a failed attempt. The job is retried until it reaches MAX_ATTEMPTS.
+
+        Nothing is recorded if the worker no longer holds the job.
+
+        Args:
+            id_ (str): The job ID.
+            worker (str): The name the job was claimed with.
+            error (str): A description of the failure.
+
+        Returns:
+            None
+        """
+        with self._write() as conn:
+            row = conn.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,"
+                " error = ?, lease_until = NULL, updated_at = ?"
+                " WHERE id = ? AND status = 'running' AND error = ?"
+                " RETURNING kind, status",
+                (MAX_ATTEMPTS, error, time.time(), id_, f"claimed by {worker}"),
+            ).fetchone()
+        if row is not None:
+            outcome = "gave_up" if row[1] == "failed" else "retry"
+            increment("enrichment_failures_total", kind=row[0], outcome=outcome)
+
+    def record_metrics(self, counters, timings):
+        """
+        Adds metrics recorded in a worker process to the totals stored in the queue.
+
+        Args:
+            counters (dict): Counter deltas, as returned by metrics.drain().
+            timings (dict): Timing deltas, as returned by metrics.drain().
+
+        Returns:
+            None
+        """
+        if not counters and not timings:
+            return
+        with self._write() as conn:
+            conn.executemany(
+                "INSERT INTO worker_counters (name, labels, value) VALUES (?, ?, ?)"
+                " ON CONFLICT (name, labels) DO UPDATE SET value = value + excluded.value",
+                [
+                    (name, json.dumps(labels), value)
+                    for (name, labels), value in counters.items()
+                ],
+            )
+            conn.executemany(
+                "INSERT INTO worker_timings (span, count, total, longest) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (span) DO UPDATE SET count = count + excluded.count,"
+                " total = total + excluded.total,"
+                " longest = MAX(longest, excluded.longest)",
+                [(span, *timing) for span, timing in timings.items()],
+            )
+
+    def worker_metrics(self):
+        """
+        Returns the metrics the worker processes have stored in the queue.
+
+        Returns:
+            tuple: (counters, timings) in the format of metrics.drain().
+        """
+        with self._read() as conn:
+            counters = {
+                (name, tuple(tuple(pair) for pair in json.loads(labels))): value
+                for name, labels, value in conn.execute(
+                    "SELECT name, labels, value FROM worker_counters"
+                )
+            }
+            timings = {
+                span: (count, total, longest)
+                for span, count, total, longest in conn.execute(
+                    "SELECT span, count, total, longest FROM worker_timings"
+                )
+            }
+        return counters, timings
+
+    def counts(self):
+        """
+        Returns the number of jobs per status.
+
+        Returns:
+            dict: A dictionary of status to job count.
+        """
+        with self._read() as conn:
+            return dict(
+                conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+            )
+
+
+class _Transaction:
+    def __init__(self, conn, begin):
+        self.conn = conn
+        self.begin = begin
+
+    def __enter__(self):
+        self.conn.execute(self.begin)
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+
+@st.cache_resource(show_spinner=False)
+def get_queue():
+    """
+    Returns the job queue shared by every session of this process.
+
+    Returns:
+        JobQueue: The job queue.
+    """
+    return JobQueue()
+
+
+def request_enrichment(text, priority=1):
+    """
+    Submits the summary, sentiment and key phrase jobs for a text and returns what is ready.
+
+    Args:
+        text (str): The article text to enrich.
+        priority (int): The priority of the jobs. Articles on screen use 1, so they are
+            enriched before articles that are only being filtered.
+
+    Returns:
+        tuple: (dict of kind to result, or None if the job has not finished,
+            set of job IDs that are still queued or running).
+    """
+    queue = get_queue()
+    ids, results, _ = queue.submit_many([(kind, text) for kind in KINDS], priority)
+    missing = [id_ for id_ in ids if results[id_] is None]
+    for kind, id_ in zip(KINDS, ids):
+        counter = "cache_misses_total" if results[id_] is None else "cache_hits_total"
+        increment(counter, cache=f"enrichment_{kind}")
+    pending = queue.pending(missing) if missing else set()
+    return {kind: results[id_] for kind, id_ in zip(KINDS, ids)}, pending
+
+
+def render_enrichment(results, pending):
+    """
+    Renders the summary, sentiment and key phrases of an article, or placeholders for them.
+
+    Args:
+        results (dict): The results returned by request_enrichment().
+        pending (set): The pending job IDs returned by request_enrichment().
+
+    Returns:
+        None
+    """
+    # imported here: utils sets up the OpenAI and Firestore clients on import
+    from utils import sentiment_box, key_phrase_box
+
+    placeholder = "_Generating..._" if pending else "_Unavailable right now._"
+
+    summary = results["summary"]
+    st.write(f"**Summary:** {summary if summary is not None else placeholder}")
+
+    sentiment = results["sentiment"]
+    if sentiment is not None:
+        st.markdown(sentiment_box(sentiment), unsafe_allow_html=True)
+    else:
+        st.write(f"**Sentiment:** {placeholder}")
+
+    st.write(f"**Key Phrases**")
+    key_phrases = results["key_phrases"]
+    if key_phrases is not None:
+        st.markdown(key_phrase_box(key_phrases.split(", ")), unsafe_allow_html=True)
+    else:
+        st.write(placeholder)
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def poll_for_results(job_ids):
+    """
+    Reruns the page as soon as any of the given jobs has finished or failed.
+
+    Args:
+        job_ids (list): The IDs of the jobs the page is waiting for.
+
+    Returns:
+        None
+    """
+    if len(get_queue().pending(job_ids)) < len(job_ids):
+        st.rerun()
+
+
+@st.cache_resource(show_spinner=False)
+def start_worker_pool():
+    """
+    Starts the enrichment worker pool as a separate process, once per Streamlit process.
+
+    The number of workers is read from ENRICHMENT_WORKERS (default 4); set it to 0 to run
+    the pool yourself with `python enrichment_worker.py`. If a pool is already running
+    against the same database, the new one exits straight away.
+
+    Returns:
+        subprocess.Popen: The pool process, or None if it was not started.
+    """
+    # LLM spans, token counts and failures are recorded in the worker processes
+    register_collector(get_queue().worker_metrics)
+    workers = int(os.environ.get("ENRICHMENT_WORKERS", "4"))
+    if workers <= 0:
+        return None
+    process = subprocess.Popen(
+        [sys.executable, "enrichment_worker.py", "--workers", str(workers)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    atexit.register(stop_worker_pool, process)
+    return process
+
+
+def stop_worker_pool(process, timeout=30):
+    """
+    Asks the worker pool to finish its current jobs and exit, and kills it if it does not.
+
+    Args:
+        process (subprocess.Popen): The pool process returned by start_worker_pool().
+        timeout (float): How long to wait for the pool to exit, in seconds.
+
+    Returns:
+        None
+    """
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
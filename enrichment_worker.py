@@ -0,0 +1,130 @@
+"""
+Enrichment worker pool.
+
+Processes the LLM enrichment and article embedding jobs that the pages submit to
+the SQLite job queue (enrichment_queue.py) in separate worker processes, so OpenAI
+latency never blocks a Streamlit script thread.
+
+Usage:
+    python enrichment_worker.py --workers 4
+"""
+
+import argparse
+import fcntl
+import multiprocessing
+import os
+import signal
+import threading
+
+from enrichment_queue import JobQueue
+from metrics import drain
+
+
+def _handlers():
+    # imported lazily: utils sets up the OpenAI and Firestore clients on import
+    from utils import get_ai_summary, get_sentiment_analysis, get_key_phrases
+    from embeddings import index_article
+
+    return {
+        "summary": get_ai_summary,
+        "sentiment": get_sentiment_analysis,
+        "key_phrases": get_key_phrases,
+        "embedding": index_article,
+    }
+
+
+def run_worker(name, stop, queue=None, poll_seconds=0.5, export_metrics=False):
+    """
+    Claims and runs jobs until the stop event is set.
+
+    Args:
+        name (str): The name of the worker, recorded on the jobs it claims.
+        stop (threading.Event or multiprocessing.Event): Set to make the worker exit.
+        queue (JobQueue): The queue to work on. Defaults to the queue at ENRICHMENT_DB.
+        poll_seconds (float): How long to wait before looking again when the queue is empty.
+        export_metrics (bool): Move the metrics of this process into the queue after every
+            job, so the app can report them. Only for worker processes: a worker thread
+            records straight into the app's own metrics.
+
+    Returns:
+        None
+    """
+    queue = queue or JobQueue()
+    handlers = _handlers()
+    while not stop.is_set():
+        job = queue.claim(name)
+        if job is None:
+            stop.wait(poll_seconds)
+            continue
+        id_, kind, payload = job
+        try:
+            result = handlers[kind](payload)
+        except Exception as e:
+            queue.fail(id_, name, f"{type(e).__name__}: {e}")
+        else:
+            queue.complete(id_, name, result)
+        if export_metrics:
+            queue.record_metrics(*drain())
+
+
+def _worker_process(index, stop):
+    # the supervisor handles Ctrl+C and SIGTERM and tells the workers through `stop`
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    run_worker(f"worker-{os.getpid()}-{index}", stop, export_metrics=True)
+
+
+def run_pool(workers):
+    """
+    Runs a pool of worker processes, restarting any that die, until interrupted.
+
+    Only one pool runs per queue database: a second pool exits immediately.
+
+    Args:
+        workers (int): The number of worker processes.
+
+    Returns:
+        None
+    """
+    queue = JobQueue()
+    lock_file = open(f"{queue.path}.lock", "w")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        print("An enrichment worker pool is already running.")
+        return
+
+    context = multiprocessing.get_context("spawn")
+    stop = context.Event()
+    shutdown = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: shutdown.set())
+
+    processes = {}
+    while not shutdown.is_set():
+        for index in range(workers):
+            process = processes.get(index)
+            if process is None or not process.is_alive():
+                process = context.Process(
+                    target=_worker_process, args=(index, stop), daemon=True
+                )
+                process.start()
+                processes[index] = process
+        shutdown.wait(1)
+
+    stop.set()
+    for process in processes.values():
+        process.join(timeout=30)
+        if process.is_alive():
+            process.terminate()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    run_pool(args.workers)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,15 @@
 import streamlit as st
-from utils import (
-    fetch_news,
-    get_ai_summary,
-    get_sentiment_analysis,
-    get_key_phrases,
-    save_article_to_firestore,
-    sentiment_box,
-    key_phrase_box,
+from utils import fetch_news, fetch_trending_topics, save_article_to_firestore
+from enrichment_queue import (
+    get_queue,
+    request_enrichment,
+    render_enrichment,
+    poll_for_results,
 )
+from trending import BUCKET_SECONDS, get_trending_engine, as_query
+from embeddings import index_articles, semantic_search, render_related
+from thumbnails import get_thumbnail_cache
+from metrics import timed, cached_call, record_cache_miss
 from datetime import datetime, timedelta
 
 # available topics and sentiment options
@@ -35,20 +37,66 @@ def local_css(file_name):
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
 
-# Cache OpenAI results to avoid repeated calls
-@st.cache_data(show_spinner=False, ttl=600)
-def cache_openai_summary(text):
-    return get_ai_summary(text)
+class NewsAPIError(Exception):
+    """Raised inside the NewsAPI caches, so error responses are not cached."""
 
 
-@st.cache_data(show_spinner=False, ttl=600)
-def cache_openai_sentiment(text):
-    return get_sentiment_analysis(text)
+# top headlines feed the trending engine; refreshed once per trending bucket, so the feed
+# costs 48 of NewsAPI's 100 daily requests
+@st.cache_data(show_spinner=False, ttl=BUCKET_SECONDS)
+def cache_top_headlines():
+    record_cache_miss()
+    news_data = fetch_trending_topics()
+    if news_data.get("status") == "error":
+        raise NewsAPIError(news_data)
+    return news_data
 
 
+# NewsAPI's free tier allows 100 requests a day, and the page reruns whenever an
+# enrichment job finishes, so results are kept for ten minutes per query
 @st.cache_data(show_spinner=False, ttl=600)
-def cache_openai_key_phrases(text):
-    return get_key_phrases(text)
+def cache_news(topics):
+    record_cache_miss()
+    news_data = fetch_news(list(topics))
+    if news_data.get("status") == "error":
+        raise NewsAPIError(news_data)
+    return news_data
+
+
+def ingest_top_headlines():
+    """
+    Feeds the current top headlines into the trending engine.
+
+    Only the top-headlines stream is ingested: search results, including the Trending
+    view's own, would make the topics that are searched for rank as rising.
+
+    Returns:
+        TrendingEngine: The trending engine.
+    """
+    engine = get_trending_engine()
+    try:
+        headlines = cached_call("newsapi_top_headlines", cache_top_headlines)
+    except NewsAPIError:
+        return engine
+    with timed("trending.ingest"):
+        engine.ingest(headlines.get("articles", []))
+    return engine
+
+
+def get_news(topics):
+    """
+    Returns the NewsAPI results for the given topics, from the cache when possible.
+
+    Args:
+        topics (list): A list of topics to search for news articles.
+
+    Returns:
+        dict: The JSON response from the News API, or the error response if the request failed.
+    """
+    try:
+        return cached_call("newsapi", cache_news, tuple(topics))
+    except NewsAPIError as e:
+        return e.args[0]
 
 
 def save_article_callback(title, url):
@@ -100,6 +148,10 @@ def filter_by_sentiment(articles, selected_sentiment):
     """
     Filters a list of articles based on the selected sentiment.
 
+    Sentiment is computed by the enrichment workers. Articles whose sentiment is not known
+    yet are left out, and their jobs are added to st.session_state.pending_jobs so the page
+    refreshes once they finish.
+
     Args:
         articles (list): A list of articles.
         selected_sentiment (str): The selected sentiment to filter by [Positive, Negative, Neutral].
@@ -108,13 +160,22 @@ def filter_by_sentiment(articles, selected_sentiment):
         list: A filtered list of articles based on the selected sentiment.
     """
     if selected_sentiment:
+        queue = get_queue()
+        texts = [article["content"] or article["description"] for article in articles]
+        ids, results, _ = queue.submit_many([("sentiment", text) for text in texts])
+
         filtered_articles = []
-        for article in articles:
-            sentiment = cache_openai_sentiment(
-                article["content"] or article["description"]
-            )
-            if sentiment.lower() == selected_sentiment.lower():
+        for article, id_ in zip(articles, ids):
+            sentiment = results[id_]
+            if sentiment and sentiment.lower() == selected_sentiment.lower():
                 filtered_articles.append(article)
+
+        pending = queue.pending([id_ for id_ in ids if results[id_] is None])
+        if pending:
+            st.info(
+                f"{len(pending)} articles are still being analysed and will appear when ready."
+            )
+            st.session_state.pending_jobs.update(pending)
         return filtered_articles
     return articles
 
@@ -126,50 +187,91 @@ def fetch_and_filter_news():
     Returns:
         A list of news articles that match the search query and selected topics, and pass the date and sentiment filters.
     """
-    if st.session_state.search_query:
+    if st.session_state.search_query and st.session_state.semantic_search:
+        st.markdown(
+            f'<div class="subheader-font">Closest matches for: {st.session_state.search_query}</div>',
+            unsafe_allow_html=True,
+        )
+        query = " ".join(
+            [st.session_state.search_query] + st.session_state.selected_topics
+        )
+        news_data = {"status": "ok", "articles": semantic_search(query)}
+    elif st.session_state.search_query:
         if st.session_state.selected_topics:
             st.markdown(
                 f'<div class="subheader-font">Results for: {st.session_state.search_query} in {", ".join(st.session_state.selected_topics)}</div>',
                 unsafe_allow_html=True,
             )
             combined_query = f"{st.session_state.search_query} AND {' AND '.join(st.session_state.selected_topics)}"
-            news_data = fetch_news([combined_query])
+            news_data = get_news([combined_query])
         else:
             st.markdown(
                 f'<div class="subheader-font">Results for: {st.session_state.search_query}</div>',
                 unsafe_allow_html=True,
             )
-            news_data = fetch_news([st.session_state.search_query])
+            news_data = get_news([st.session_state.search_query])
     else:
         if st.session_state.selected_topics:
             st.markdown(
                 f'<div class="subheader-font">Results for: {", ".join(st.session_state.selected_topics)}</div>',
                 unsafe_allow_html=True,
             )
-            news_data = fetch_news(st.session_state.selected_topics)
+            news_data = get_news(st.session_state.selected_topics)
         else:
             st.markdown(
                 '<div class="subheader-font">Trending Topics</div>',
                 unsafe_allow_html=True,
             )
             st.markdown("---")
-            news_data = fetch_news(["trending"])
+            rising = [as_query(term) for term, _ in ingest_top_headlines().rising(5)]
+            if not rising:
+                st.info(
+                    "Nothing is rising in the headlines right now. Search for a topic or filter by topics above."
+                )
+                return []
+            news_data = get_news(rising)
 
     if news_data.get("status") == "error":
         st.error(f"Error fetching news: {news_data.get('message')}")
         return []
 
     articles = news_data.get("articles", [])
+    with timed("embeddings.ingest"):
+        index_articles(articles)
 
     if st.session_state.selected_date:
-        articles = filter_by_date(articles, st.session_state.selected_date)
+        with timed("filter.date"):
+            articles = filter_by_date(articles, st.session_state.selected_date)
 
     if st.session_state.selected_sentiment:
-        articles = filter_by_sentiment(articles, st.session_state.selected_sentiment)
+        with timed("filter.sentiment"):
+            articles = filter_by_sentiment(
+                articles, st.session_state.selected_sentiment
+            )
 
     return articles
 
 
+def trending_chips():
+    """
+    Renders the fastest-rising topics as buttons that search for the topic when clicked.
+
+    Returns:
+        None
+    """
+    rising = ingest_top_headlines().rising(6)
+    if not rising:
+        return
+    st.write("**Rising now**")
+    columns = st.columns(len(rising))
+    for index, (column, (term, _)) in enumerate(zip(columns, rising)):
+        with column:
+            if st.button(term.title(), key=f"trending_{index}"):
+                st.session_state.search_query = as_query(term)
+                st.session_state.articles_shown = 10
+                st.rerun()
+
+
 def home():
     local_css("styles/styles.css")
     st.markdown('<div class="big-font">News.AI</div>', unsafe_allow_html=True)
@@ -185,6 +287,7 @@ def home():
         st.session_state.selected_sentiment = ""
     if "search_query" not in st.session_state:
         st.session_state.search_query = ""
+    st.session_state.pending_jobs = set()
 
     # display filters in a single row
     col1, col2, col3 = st.columns(3)
@@ -222,6 +325,10 @@ def home():
 
     # search bar
     search_query = st.text_input("Search for news topics", "")
+    st.session_state.semantic_search = st.checkbox(
+        "Search by meaning in articles seen so far",
+        help="Matches articles loaded earlier by similarity instead of keywords.",
+    )
     if st.button("Search"):
         if search_query:
             st.session_state.search_query = search_query
@@ -229,10 +336,20 @@ def home():
         else:
             st.session_state.search_query = ""
 
-    articles = fetch_and_filter_news()
+    trending_chips()
+
+    with timed("home.fetch_and_filter"):
+        articles = fetch_and_filter_news()
+
+    # fetch the resized images of the visible articles in parallel
+    visible = articles[: st.session_state.articles_shown]
+    with timed("home.images"):
+        images = get_thumbnail_cache().fetch_many(
+            [article.get("urlToImage") for article in visible]
+        )
 
     # show first 10 articles
-    for index, article in enumerate(articles[: st.session_state.articles_shown]):
+    for index, article in enumerate(visible):
 
         # filter out articles with 'removed'
         if any("removed" in str(value).lower() for value in article.values()):
@@ -256,20 +373,14 @@ def home():
             save_article_callback(article["title"], article["url"])
 
         if article.get("urlToImage"):
-            st.image(article["urlToImage"], width=700)
-
-        summary = cache_openai_summary(article["content"] or article["description"])
-        st.write(f"**Summary:** {summary}")
+            st.image(images[article["urlToImage"]], width=700)
 
-        sentiment = cache_openai_sentiment(article["content"] or article["description"])
-        st.markdown(sentiment_box(sentiment), unsafe_allow_html=True)
-
-        key_phrases = cache_openai_key_phrases(
-            article["content"] or article["description"]
-        )
-        key_phrases_list = key_phrases.split(", ")
-        st.write(f"**Key Phrases**")
-        st.markdown(key_phrase_box(key_phrases_list), unsafe_allow_html=True)
+        text = article["content"] or article["description"]
+        with timed("enrich.request"):
+            results, pending = request_enrichment(text)
+        render_enrichment(results, pending)
+        st.session_state.pending_jobs.update(pending)
+        render_related(text)
 
         st.markdown("---")
 
@@ -285,6 +396,10 @@ def home():
             st.session_state.articles_shown += 10
             st.rerun()
 
+    # refresh the page when the enrichment workers finish a pending job
+    if st.session_state.pending_jobs:
+        poll_for_results(sorted(st.session_state.pending_jobs))
+
     st.markdown("</div>", unsafe_allow_html=True)
 
 
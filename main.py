@@ -2,6 +2,8 @@ import streamlit as st
 from home import home
 from news_visualizations import news_visualizations
 from bookmarks import display_bookmarked_articles
+from metrics import start_rerun, start_metrics_server, render_debug_panel, timed
+from enrichment_queue import start_worker_pool
 
 
 # main function to control the navigation
@@ -18,16 +20,25 @@ def main():
     Returns:
         None
     """
+    start_rerun()
+    start_metrics_server()
+    start_worker_pool()
+
     # Render the sidebar for navigation
     st.sidebar.title("Navigation")
     page = st.sidebar.radio("Go to", ["Home", "News Visualizations", "Bookmarks"])
-
-    if page == "Home":
-        home()
-    elif page == "News Visualizations":
-        news_visualizations()
-    elif page == "Bookmarks":
-        display_bookmarked_articles()
+    show_debug = st.sidebar.checkbox("Show performance debug", value=False)
+
+    with timed(f"page.{page.lower().replace(' ', '_')}"):
+        if page == "Home":
+            home()
+        elif page == "News Visualizations":
+            news_visualizations()
+        elif page == "Bookmarks":
+            display_bookmarked_articles()
+
+    if show_debug:
+        render_debug_panel()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,534 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import requests
+import streamlit as st
+
+from metrics import increment, timed
+
+# default location of the price store; override with the MARKET_DIR environment variable
+STORE_DIR = ".cache/market"
+
+# Alpha Vantage free tier limits; override with ALPHAVANTAGE_CALLS_PER_MINUTE / _PER_DAY
+CALLS_PER_MINUTE = 5
+CALLS_PER_DAY = 25
+
+# daily bars only change once per trading day, when the day's bar is published after the
+# New York close; a symbol is refreshed once its data is older than the last close
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+CLOSE_HOUR, CLOSE_MINUTE = 16, 30
+
+# symbols nobody has looked at for this long are no longer refreshed
+WANTED_SECONDS = 3600
+
+# unknown symbols are not requested again for this long
+FAILED_RETRY_SECONDS = 24 * 3600
+
+# how often the page checks for newly fetched symbols
+POLL_SECONDS = 5
+
+# tickers followed for each news topic on the home page
+WATCHLIST = {
+    "Technology": ["AAPL", "MSFT", "NVDA", "GOOGL", "META"],
+    "Business": ["SPY", "JPM", "GS", "WMT"],
+    "Politics": ["LMT", "RTX", "GD"],
+    "Health": ["JNJ", "PFE", "UNH", "MRNA"],
+    "Science": ["TMO", "AMGN", "ISRG"],
+    "Entertainment": ["DIS", "NFLX", "WBD"],
+    "Sports": ["NKE", "MSGS"],
+    "World": ["EEM", "EFA", "FXI"],
+    "Lifestyle": ["COST", "SBUX", "LULU"],
+    "Environment": ["TSLA", "ENPH", "XOM", "ICLN"],
+}
+
+INTERVALS = {"Daily": None, "Weekly": "W-FRI", "Monthly": "ME"}
+
+_COLUMNS = ["open", "high", "low", "close", "volume"]
+_SYMBOL = re.compile(r"^[A-Z0-9.\-]{1,12}$")
+
+
+def watchlist_symbols(topics):
+    """
+    Returns the tickers followed for the given topics, without duplicates.
+
+    Args:
+        topics (list): A list of topics, keys of WATCHLIST.
+
+    Returns:
+        list: The ticker symbols, in watchlist order.
+    """
+    return list(dict.fromkeys(s for topic in topics for s in WATCHLIST.get(topic, [])))
+
+
+def parse_daily_series(data):
+    """
+    Converts an Alpha Vantage TIME_SERIES_DAILY response into an OHLCV DataFrame.
+
+    Args:
+        data (dict): The JSON response.
+
+    Returns:
+        pandas.DataFrame: The bars indexed by date, oldest first.
+    """
+    df = pd.DataFrame.from_dict(data["Time Series (Daily)"], orient="index")
+    # "1. open" -> "open"
+    df.columns = [column.split(". ", 1)[-1] for column in df.columns]
+    df = df[_COLUMNS]
+    df.index = pd.to_datetime(df.index, format="%Y-%m-%d")
+    df.index.name = "date"
+    df = df.astype({column: "float32" for column in _COLUMNS[:4]})
+    df["volume"] = df["volume"].astype("int64")
+    return df.sort_index()
+
+
+def resample_ohlc(df, rule):
+    """
+    Aggregates daily bars into weekly or monthly bars.
+
+    Args:
+        df (pandas.DataFrame): Daily OHLCV bars indexed by date.
+        rule (str): A pandas offset alias such as "W-FRI" or "ME", or None for daily bars.
+
+    Returns:
+        pandas.DataFrame: The resampled bars.
+    """
+    if rule is None:
+        return df
+    bars = df.resample(rule).agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+    )
+    return bars.dropna(subset=["close"])
+
+
+def last_close(now=None):
+    """
+    Returns the most recent weekday close at which the day's bar is available.
+
+    Exchange holidays are not known, so a holiday still counts as a trading day and costs
+    one unneeded fetch per symbol.
+
+    Args:
+        now (float): The current time, in seconds since the epoch.
+
+    Returns:
+        float: The time of the close, in seconds since the epoch.
+    """
+    now = datetime.fromtimestamp(time.time() if now is None else now, MARKET_TIMEZONE)
+    close = now.replace(hour=CLOSE_HOUR, minute=CLOSE_MINUTE, second=0, microsecond=0)
+    if close > now:
+        close -= timedelta(days=1)
+    while close.weekday() >= 5:
+        close -= timedelta(days=1)
+    return close.timestamp()
+
+
+class MarketStore:
+    """
+    Daily price series stored as one Parquet file per symbol.
+
+    Loaded frames and their resampled views are cached in memory and shared by every
+    session until the file changes, so they must be treated as read-only.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.environ.get("MARKET_DIR", STORE_DIR)
+        os.makedirs(self.directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def _path(self, symbol):
+        return os.path.join(self.directory, f"{symbol}.parquet")
+
+    def fetched_at(self, symbol):
+        """
+        Returns when a symbol was last stored, or None if it has never been fetched.
+
+        Args:
+            symbol (str): The ticker symbol.
+
+        Returns:
+            float: The time of the last update, in seconds since the epoch.
+        """
+        try:
+            return os.path.getmtime(self._path(symbol))
+        except FileNotFoundError:
+            return None
+
+    def view(self, symbol, interval="Daily"):
+        """
+        Returns the bars of a symbol at the given interval.
+
+        Args:
+            symbol (str): The ticker symbol.
+            interval (str): One of INTERVALS.
+
+        Returns:
+            pandas.DataFrame: The bars, or None if the symbol has not been fetched yet.
+        """
+        fetched_at = self.fetched_at(symbol)
+        if fetched_at is None:
+            return None
+        key = (symbol, interval)
+        with self._lock:
+            cached = self._views.get(key)
+        if cached is not None and cached[0] == fetched_at:
+            increment("cache_hits_total", cache="market_views")
+            return cached[1]
+        increment("cache_misses_total", cache="market_views")
+        with timed("market.load"):
+            bars = resample_ohlc(
+                pd.read_parquet(self._path(symbol)), INTERVALS[interval]
+            )
+        with self._lock:
+            self._views[key] = (fetched_at, bars)
+        return bars
+
+    def merge(self, symbol, bars):
+        """
+        Adds newly fetched bars to the stored series of a symbol.
+
+        Bars for dates that are already stored replace the stored ones.
+
+        Args:
+            symbol (str): The ticker symbol.
+            bars (pandas.DataFrame): The fetched daily bars.
+
+        Returns:
+            int: The number of bars stored for the symbol.
+        """
+        path = self._path(symbol)
+        if os.path.exists(path):
+            bars = pd.concat([pd.read_parquet(path), bars])
+            bars = bars[~bars.index.duplicated(keep="last")].sort_index()
+        temp_path = f"{path}.tmp"
+        bars.to_parquet(temp_path)
+        os.replace(temp_path, path)
+        return len(bars)
+
+
+class RateLimiter:
+    """
+    Token bucket for the per-minute limit, plus a rolling 24-hour count for the daily cap.
+
+    The daily count is kept in memory, so it starts over when the process restarts.
+    """
+
+    def __init__(self, per_minute, per_day):
+        self.per_minute = per_minute
+        self.per_day = per_day
+        self._tokens = float(per_minute)
+        self._updated = time.monotonic()
+        self._calls = deque()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(
+            self.per_minute,
+            self._tokens + (now - self._updated) * self.per_minute / 60,
+        )
+        self._updated = now
+        while self._calls and self._calls[0] < now - 86400:
+            self._calls.popleft()
+
+    def delay(self):
+        """
+        Returns how long until the next call is allowed.
+
+        Returns:
+            float: The wait in seconds, 0 if a call can be made now.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            waits = [
+                self._paused_until - now,
+                (1 - self._tokens) * 60 / self.per_minute,
+            ]
+            if len(self._calls) >= self.per_day:
+                waits.append(self._calls[0] + 86400 - now)
+            return max(0.0, *waits)
+
+    def remaining(self):
+        """
+        Returns how many calls are left in the rolling 24-hour budget.
+
+        Returns:
+            int: The number of calls.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0, self.per_day - len(self._calls))
+
+    def try_acquire(self):
+        """
+        Takes a call from the budget if one is available.
+
+        Returns:
+            bool: True if the call may be made.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if (
+                now < self._paused_until
+                or self._tokens < 1
+                or len(self._calls) >= self.per_day
+            ):
+                return False
+            self._tokens -= 1
+            self._calls.append(now)
+            return True
+
+    def pause(self, seconds):
+        """
+        Stops handing out calls for a while, e.g. after the provider reported a limit.
+
+        Args:
+            seconds (float): How long to pause.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._tokens = 0.0
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class MarketDataScheduler:
+    """
+    Keeps the price series of the requested symbols up to date from a background thread.
+
+    Pages only say which symbols they show and read whatever is stored, so a render never
+    waits for the API. The thread fetches one stale symbol at a time within the rate
+    limit, oldest data first, using the 100-bar "compact" output to top up stored series.
+    A symbol is stale when it was last fetched before the most recent market close.
+    """
+
+    def __init__(self, api_key, store=None, limiter=None, full_history=False):
+        self.api_key = api_key
+        self.store = store or MarketStore()
+        self.limiter = limiter or RateLimiter(
+            int(os.environ.get("ALPHAVANTAGE_CALLS_PER_MINUTE", CALLS_PER_MINUTE)),
+            int(os.environ.get("ALPHAVANTAGE_CALLS_PER_DAY", CALLS_PER_DAY)),
+        )
+        # "full" history is a premium feature; it is only used for a symbol's first fetch
+        self.full_history = full_history
+        self.version = 0
+        self._wanted = {}
+        self._failed = {}
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, name="market-data", daemon=True
+        )
+        self._thread.start()
+
+    def _is_stale(self, symbol, now):
+        fetched_at = self.store.fetched_at(symbol)
+        return fetched_at is None or fetched_at < last_close(now)
+
+    def request(self, symbols):
+        """
+        Marks symbols as wanted and returns the ones still waiting for fresh data.
+
+        Args:
+            symbols (list): A list of ticker symbols.
+
+        Returns:
+            list: The symbols that have not been fetched yet or are being refreshed.
+        """
+        now = time.time()
+        symbols = [symbol for symbol in symbols if _SYMBOL.match(symbol)]
+        with self._condition:
+            for symbol in symbols:
+                self._wanted[symbol] = now
+            self._condition.notify()
+            failed = {s for s, until in self._failed.items() if until > now}
+        return [s for s in symbols if s not in failed and self._is_stale(s, now)]
+
+    def _next_symbol(self):
+        now = time.time()
+        candidates = [
+            symbol
+            for symbol, requested in self._wanted.items()
+            if now - requested < WANTED_SECONDS
+            and self._failed.get(symbol, 0) <= now
+            and self._is_stale(symbol, now)
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda s: self.store.fetched_at(s) or 0)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                symbol = self._next_symbol()
+                if symbol is None:
+                    self._condition.wait(60)
+                    continue
+            if not self.limiter.try_acquire():
+                time.sleep(min(self.limiter.delay(), 60) or 0.1)
+                continue
+            try:
+                self._fetch(symbol)
+            except Exception:
+                # network errors and bad payloads: try the symbol again later
+                with self._condition:
+                    self._failed[symbol] = time.time() + 300
+
+    def _fetch(self, symbol):
+        outputsize = "compact"
+        if self.full_history and self.store.fetched_at(symbol) is None:
+            outputsize = "full"
+        url = (
+            "https://www.alphavantage.co/query?function=TIME_SERIES_DAILY"
+            f"&symbol={symbol}&outputsize={outputsize}&apikey={self.api_key}"
+        )
+        with timed("market.fetch"):
+            data = requests.get(url, timeout=30).json()
+        increment("market_fetches_total", outputsize=outputsize)
+
+        if "Time Series (Daily)" in data:
+            self.store.merge(symbol, parse_daily_series(data))
+            with self._condition:
+                self.version += 1
+        elif "Note" in data or "Information" in data:
+            # the provider counted more calls than we did, e.g. another app on the same key
+            increment("market_rate_limited_total")
+            self.limiter.pause(60)
+        else:
+            increment("errors_total", span="market.fetch")
+            with self._condition:
+                self._failed[symbol] = time.time() + FAILED_RETRY_SECONDS
+
+    def next_fetch_in(self):
+        """
+        Returns roughly how long until the next fetch is allowed.
+
+        Returns:
+            float: The wait in seconds.
+        """
+        return self.limiter.delay()
+
+    def fetches_left(self):
+        """
+        Returns how many fetches the daily limit still allows.
+
+        Returns:
+            int: The number of fetches.
+        """
+        return self.limiter.remaining()
+
+
+@st.cache_resource(show_spinner=False)
+def get_market_scheduler():
+    """
+    Returns the market data scheduler shared by every session of this process.
+
+    Returns:
+        MarketDataScheduler: The scheduler, with its background thread running.
+    """
+    return MarketDataScheduler(st.secrets["STOCKS_API_KEY"])
+
+
+@st.fragment(run_every=POLL_SECONDS)
+def poll_for_market_data(version):
+    """
+    Reruns the page as soon as the scheduler has stored new data, or once the daily limit
+    is used up, so the page stops polling for symbols that cannot arrive until it resets.
+
+    Args:
+        version (int): The scheduler version the page was rendered with.
+
+    Returns:
+        None
+    """
+    scheduler = get_market_scheduler()
+    if scheduler.version != version or not scheduler.fetches_left():
+        st.rerun()
+
+
+def market_panel():
+    """
+    Renders the watchlist for the selected topics: relative performance of every symbol
+    and a candlestick chart of one of them, from whatever data is already stored.
+
+    Returns:
+        None
+    """
+    topics = st.multiselect(
+        "Topics",
+        list(WATCHLIST),
+        default=["Technology", "Business"],
+        key="market_topics",
+    )
+    interval = st.radio(
+        "Interval", list(INTERVALS), horizontal=True, key="market_interval"
+    )
+    symbols = watchlist_symbols(topics)
+
+    scheduler = get_market_scheduler()
+    version = scheduler.version
+    pending = scheduler.request(symbols)
+
+    bars = {}
+    for symbol in symbols:
+        view = scheduler.store.view(symbol, interval)
+        if view is not None and len(view):
+            bars[symbol] = view
+
+    if bars:
+        closes = pd.DataFrame({symbol: view["close"] for symbol, view in bars.items()})
+        # change since the first bar of each symbol, so different price levels compare
+        performance = closes.div(closes.bfill().iloc[0]).sub(1).mul(100)
+        fig = px.line(
+            performance,
+            title="Relative Performance",
+            labels={"value": "Change (%)", "date": "Date", "variable": "Symbol"},
+        )
+        st.plotly_chart(fig)
+
+        symbol = st.selectbox("Symbol", list(bars), key="market_symbol")
+        view = bars[symbol]
+        fig = go.Figure(
+            go.Candlestick(
+                x=view.index,
+                open=view["open"],
+                high=view["high"],
+                low=view["low"],
+                close=view["close"],
+            )
+        )
+        fig.update_layout(
+            title=f"{symbol} ({interval})", xaxis_rangeslider_visible=False
+        )
+        st.plotly_chart(fig)
+
+    if pending and not scheduler.fetches_left():
+        # nothing more can arrive until the daily limit resets, so there is nothing to poll for
+        hours = scheduler.next_fetch_in() / 3600
+        st.caption(
+            f"{len(bars)} of {len(symbols)} symbols loaded; {len(pending)} wait for the"
+            f" data provider's daily limit, which resets in about {hours:.1f} h."
+        )
+    elif pending:
+        status = (
+            f"{len(bars)} of {len(symbols)} symbols loaded, {len(pending)} updating"
+        )
+        wait = scheduler.next_fetch_in()
+        if wait >= 1:
+            status += (
+                f"; the data provider allows the next request in about {wait:.0f} s"
+            )
+        st.caption(f"{status}.")
+        poll_for_market_data(version)
+    elif not symbols:
+        st.info("Choose at least one topic.")
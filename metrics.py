@@ -0,0 +1,353 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import streamlit as st
+
+logger = logging.getLogger(__name__)
+
+# process-wide metric storage, shared by every session thread
+_lock = threading.Lock()
+_counters = defaultdict(float)
+_timings = {}
+
+# functions returning metrics recorded by other processes, e.g. the enrichment workers
+_collectors = []
+
+# per-thread state: Streamlit runs each session's rerun on its own script thread
+_local = threading.local()
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def increment(name, value=1, **labels):
+    """
+    Increments a process-wide counter.
+
+    Args:
+        name (str): The name of the counter, e.g. "llm_tokens_total".
+        value (float): The amount to add to the counter.
+        **labels: Optional label values that identify the series, e.g. model="gpt-3.5-turbo".
+
+    Returns:
+        None
+    """
+    with _lock:
+        _counters[(name, _label_key(labels))] += value
+
+
+def record_error(span):
+    """
+    Records an error for the given span without raising.
+
+    Use this for failures that are reported in a response body rather than as an exception.
+
+    Args:
+        span (str): The name of the span the error belongs to.
+
+    Returns:
+        None
+    """
+    increment("errors_total", span=span)
+
+
+@contextmanager
+def timed(span):
+    """
+    Context manager that times a block of code and records it under the given span name.
+
+    The duration is added to the process-wide timings and to the breakdown of the current rerun.
+    Exceptions raised inside the block are counted in "errors_total" and re-raised.
+
+    Args:
+        span (str): The name of the span, e.g. "news.fetch".
+    """
+    depth = getattr(_local, "depth", 0)
+    _local.depth = depth + 1
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        record_error(span)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        _local.depth = depth
+        increment("calls_total", span=span)
+        with _lock:
+            count, total, longest = _timings.get(span, (0, 0.0, 0.0))
+            _timings[span] = (count + 1, total + elapsed, max(longest, elapsed))
+        spans = getattr(_local, "spans", None)
+        if spans is not None:
+            spans.append((depth, span, elapsed, start))
+
+
+def record_cache_miss():
+    """
+    Marks the current cache lookup as a miss.
+
+    Call this from inside a function decorated with st.cache_data / st.cache_resource;
+    the body only runs when the cache has no entry for the arguments.
+
+    Returns:
+        None
+    """
+    _local.cache_miss = True
+
+
+def cached_call(cache, func, *args):
+    """
+    Calls a cached function and counts the lookup as a hit or a miss.
+
+    Args:
+        cache (str): The name of the cache, used as a label on the counters.
+        func (callable): The cached function. It must call record_cache_miss() in its body.
+        *args: Arguments passed to the function.
+
+    Returns:
+        The return value of the cached function.
+    """
+    _local.cache_miss = False
+    result = func(*args)
+    if _local.cache_miss:
+        increment("cache_misses_total", cache=cache)
+    else:
+        increment("cache_hits_total", cache=cache)
+    _local.cache_miss = False
+    return result
+
+
+def start_rerun():
+    """
+    Starts collecting the span breakdown for the current rerun of the script thread.
+
+    Returns:
+        None
+    """
+    _local.spans = []
+    _local.depth = 0
+    increment("reruns_total")
+
+
+def rerun_breakdown():
+    """
+    Returns the spans recorded since the last call to start_rerun(), in start order.
+
+    Returns:
+        list: A list of (depth, span, seconds) tuples.
+    """
+    spans = getattr(_local, "spans", None) or []
+    return [
+        (depth, span, elapsed)
+        for depth, span, elapsed, _ in sorted(spans, key=lambda entry: entry[3])
+    ]
+
+
+def register_collector(collector):
+    """
+    Adds the metrics of another source to snapshot() and render_prometheus().
+
+    Args:
+        collector (callable): Returns (counters, timings) in the format of drain().
+
+    Returns:
+        None
+    """
+    with _lock:
+        if collector not in _collectors:
+            _collectors.append(collector)
+
+
+def drain():
+    """
+    Returns all counters and timings recorded so far and resets them.
+
+    Used by processes that export their metrics elsewhere, e.g. the enrichment workers.
+
+    Returns:
+        tuple: (dict of (name, label tuple) to value, dict of span to (count, total, max)).
+    """
+    global _counters, _timings
+    with _lock:
+        counters, timings = dict(_counters), _timings
+        _counters, _timings = defaultdict(float), {}
+    return counters, timings
+
+
+def _merged():
+    with _lock:
+        counters = defaultdict(float, _counters)
+        timings = dict(_timings)
+        collectors = list(_collectors)
+    for collector in collectors:
+        try:
+            extra_counters, extra_timings = collector()
+        except Exception:
+            # a broken source must not take the app's own metrics down with it
+            increment("errors_total", span="metrics.collect")
+            continue
+        for key, value in extra_counters.items():
+            counters[key] += value
+        for span, (count, total, longest) in extra_timings.items():
+            own_count, own_total, own_longest = timings.get(span, (0, 0.0, 0.0))
+            timings[span] = (
+                own_count + count,
+                own_total + total,
+                max(own_longest, longest),
+            )
+    return sorted(counters.items()), sorted(timings.items())
+
+
+def snapshot():
+    """
+    Returns a JSON-serialisable dump of all counters and timings, including those of
+    registered collectors.
+
+    Returns:
+        dict: A dictionary with "counters" and "timings" entries.
+    """
+    counters, timings = _merged()
+    return {
+        "counters": [
+            {"name": name, "labels": dict(labels), "value": value}
+            for (name, labels), value in counters
+        ],
+        "timings": {
+            span: {
+                "count": count,
+                "total_seconds": total,
+                "mean_seconds": total / count if count else 0.0,
+                "max_seconds": longest,
+            }
+            for span, (count, total, longest) in timings
+        },
+    }
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        pairs.append(f'{key}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def render_prometheus():
+    """
+    Renders all metrics in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics as Prometheus text.
+    """
+    lines = []
+    counters, timings = _merged()
+
+    seen = set()
+    for (name, labels), value in counters:
+        metric = f"newsai_{name}"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value:g}")
+
+    if timings:
+        lines.append("# TYPE newsai_span_seconds summary")
+        for span, (count, total, _) in timings:
+            labels = _format_labels((("span", span),))
+            lines.append(f"newsai_span_seconds_count{labels} {count}")
+            lines.append(f"newsai_span_seconds_sum{labels} {total:.6f}")
+        lines.append("# TYPE newsai_span_seconds_max gauge")
+        for span, (_, _, longest) in timings:
+            labels = _format_labels((("span", span),))
+            lines.append(f"newsai_span_seconds_max{labels} {longest:.6f}")
+
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body = render_prometheus().encode()
+            content_type = "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body = json.dumps(snapshot(), indent=2).encode()
+            content_type = "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # keep scrapes out of the Streamlit log
+        pass
+
+
+@st.cache_resource(show_spinner=False)
+def start_metrics_server():
+    """
+    Starts the metrics HTTP endpoint once per process, if METRICS_PORT is set.
+
+    The server exposes /metrics (Prometheus text) and /metrics.json (JSON dump). It has no
+    authentication, so it listens on 127.0.0.1 unless METRICS_HOST says otherwise.
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if METRICS_PORT is not set or
+            the port could not be bound.
+    """
+    port = os.environ.get("METRICS_PORT")
+    if not port:
+        return None
+    host = os.environ.get("METRICS_HOST", "127.0.0.1")
+    try:
+        server = ThreadingHTTPServer((host, int(port)), _MetricsHandler)
+    except OSError as e:
+        # returning None caches the failure, so it is not retried on every rerun
+        logger.warning("Metrics endpoint not started on %s:%s: %s", host, port, e)
+        return None
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def render_debug_panel():
+    """
+    Renders the timing breakdown of the current rerun and the process-wide counters in the sidebar.
+
+    Returns:
+        None
+    """
+    breakdown = rerun_breakdown()
+    with st.sidebar.expander("Performance (this rerun)", expanded=True):
+        if not breakdown:
+            st.write("No spans recorded.")
+        for depth, span, elapsed in breakdown:
+            indent = "&nbsp;" * 4 * depth
+            st.markdown(
+                f"{indent}`{span}` {elapsed * 1000:.1f} ms", unsafe_allow_html=True
+            )
+
+    with st.sidebar.expander("Counters (app and enrichment workers)"):
+        data = snapshot()
+        for counter in data["counters"]:
+            labels = ", ".join(f"{k}={v}" for k, v in counter["labels"].items())
+            suffix = f" ({labels})" if labels else ""
+            st.write(f"{counter['name']}{suffix}: {counter['value']:g}")
+        st.download_button(
+            "Download JSON",
+            json.dumps(data, indent=2),
+            file_name="metrics.json",
+            mime="application/json",
+        )
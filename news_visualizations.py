@@ -3,10 +3,11 @@ import requests
 import os
 import pandas as pd
 import plotly.express as px
+from metrics import timed, cached_call, record_cache_miss
+from market_data import market_panel
 
 
 BLS_API_KEY = st.secrets["BLS_API_KEY"]
-STOCKS_API_KEY = st.secrets["STOCKS_API_KEY"]
 
 
 # load CSS file
@@ -15,14 +16,44 @@ def local_css(file_name):
         st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
 
 
-@st.cache_data(show_spinner=True, ttl=3600)  # cache the data for an hour
+# The datasets are held once per process with st.cache_resource, instead of st.cache_data's
+# per-call unpickled copy, and derived columns are computed at load time. What keeps one
+# session's changes away from the others is that pages only use a shallow copy, made with
+# copy(deep=False): with pandas 3 copy-on-write it shares the data, and any change to it
+# copies first. The shared frame itself is not protected: adding or replacing a column, or
+# setting a string or category value, changes it for every session. read_only() only makes
+# element writes into its numeric and date arrays raise ValueError.
+
+
+def read_only(df):
+    """
+    Returns a DataFrame with the same data whose numeric and date arrays are not writable.
+
+    Args:
+        df (pandas.DataFrame): The DataFrame to protect.
+
+    Returns:
+        pandas.DataFrame: The read-only DataFrame.
+    """
+    columns = {}
+    for name, column in df.items():
+        if column.dtype.kind in "biufmM":
+            values = column.to_numpy(copy=True)
+            values.flags.writeable = False
+            column = pd.Series(values, index=df.index, name=name, copy=False)
+        columns[name] = column
+    return pd.DataFrame(columns, copy=False)
+
+
+@st.cache_resource(show_spinner=True, ttl=3600)  # cache the data for an hour
 def get_inflation_data():
     """
     Retrieves inflation data from the Bureau of Labor Statistics (BLS) API and returns it as a DataFrame.
 
     Returns:
-        df (pandas.DataFrame): DataFrame containing the inflation data.
+        df (pandas.DataFrame): Shared, read-only DataFrame with the date and CPI value of each month.
     """
+    record_cache_miss()
     series_id = "CUSR0000SA0"  # series ID for Consumer Price Index
     api_key = BLS_API_KEY
     url = f"https://api.bls.gov/publicAPI/v2/timeseries/data/{series_id}?registrationkey={api_key}"
@@ -36,76 +67,73 @@ def get_inflation_data():
     df["date"] = pd.to_datetime(
         df["year"] + df["period"].str.replace("M", ""), format="%Y%m"
     )
+    df["value"] = df["value"].astype(float)
 
-    df = df.sort_values("date")
+    df = df[["date", "value"]].sort_values("date")
 
     df = df.reset_index(drop=True)
 
-    return df
+    return read_only(df)
 
 
-@st.cache_data(show_spinner=True, ttl=3600)
+@st.cache_resource(show_spinner=True, ttl=3600)
 def get_presidential_approval_data():
     """
     Retrieves presidential approval data from a CSV file and returns a filtered DataFrame.
 
+    The 30-poll moving average of each candidate is precomputed as "smoothed_pct".
+
     Returns:
-        pandas.DataFrame: A DataFrame containing the filtered presidential approval data.
+        pandas.DataFrame: Shared, read-only DataFrame containing the filtered presidential approval data.
     """
+    record_cache_miss()
     url = "https://projects.fivethirtyeight.com/polls-page/data/president_polls.csv"
-    data = pd.read_csv(url)
+    # only the columns we plot, parsed by the multi-threaded Arrow reader
+    data = pd.read_csv(
+        url, usecols=["end_date", "candidate_name", "pct"], engine="pyarrow"
+    )
 
-    data["end_date"] = pd.to_datetime(data["end_date"])
+    # an explicit format avoids parsing every date separately with dateutil
+    data["end_date"] = pd.to_datetime(data["end_date"], format="%m/%d/%y")
 
     data = data[
         (data["candidate_name"].isin(["Donald Trump", "Joe Biden"]))
         & (data["end_date"].dt.year.isin([2020, 2021, 2022, 2023, 2024]))
     ]
 
-    data = data[["end_date", "candidate_name", "pct"]]
-
-    return data
-
-
-@st.cache_data(show_spinner=True, ttl=3600)
-def get_stock_data():
-    """
-    Retrieves daily stock data for a given symbol from Alpha Vantage API.
-
-    Returns:
-    pandas.DataFrame: A DataFrame containing the daily stock data with columns for open, high, low, close, and volume.
-    """
-    symbol = "AAPL"
-    api_key = STOCKS_API_KEY
-    url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={symbol}&apikey={api_key}"
-    response = requests.get(url)
-    data = response.json()
-    time_series = data["Time Series (Daily)"]
-
-    df = pd.DataFrame.from_dict(time_series, orient="index", dtype="float")
-    df.index = pd.to_datetime(df.index)
+    data = data.astype({"candidate_name": "category", "pct": "float32"})
 
-    df.columns = ["open", "high", "low", "close", "volume"]
-
-    df = df.sort_index()
+    # moving average to smooth the data
+    data["smoothed_pct"] = (
+        data.groupby("candidate_name", observed=True)["pct"]
+        .rolling(window=30, min_periods=1)
+        .mean()
+        .droplevel(0)
+        .astype("float32")
+    )
 
-    return df
+    return read_only(data)
 
 
-@st.cache_data(show_spinner=True, ttl=3600)
+@st.cache_resource(show_spinner=True, ttl=3600)
 def get_palestinian_death_toll_data():
     """
     Retrieves the Palestinian death toll data from a specified URL and returns it as a pandas DataFrame.
 
     Returns:
-        pandas.DataFrame: The Palestinian death toll data.
+        pandas.DataFrame: Shared, read-only DataFrame with the daily Palestinian death toll data.
     """
+    record_cache_miss()
     url = "https://data.humdata.org/dataset/a02d750c-b2f7-4e22-b884-e9e495209a3a/resource/429619ed-8b50-4a01-a2b3-88601bc606ce/download/opt_-escalation-of-hostilities-impact-4-1-1-1-1-1.xlsx"
     gaza_data = pd.read_excel(url, sheet_name="Gaza")
 
+    columns = ["killed total", "killed female", "killed male", "killed undefined"]
+    gaza_data = gaza_data[["date"] + columns].astype(
+        {column: "float32" for column in columns}
+    )
     gaza_data["date"] = pd.to_datetime(gaza_data["date"], format="%d-%b-%Y")
 
-    return gaza_data
+    return read_only(gaza_data)
 
 
 def plot_death_toll_data(df, region):
@@ -153,7 +181,10 @@ def news_visualizations():
     )
 
     st.header("1. Inflation in America")
-    inflation_data = get_inflation_data()
+    with timed("viz.inflation"):
+        inflation_data = cached_call("viz_inflation", get_inflation_data).copy(
+            deep=False
+        )
     fig = px.line(
         inflation_data,
         x="date",
@@ -166,7 +197,10 @@ def news_visualizations():
     st.markdown("---")
 
     st.header("2. Presidential Candidate Approval Ratings")
-    approval_data = get_presidential_approval_data()
+    with timed("viz.approval"):
+        approval_data = cached_call(
+            "viz_approval", get_presidential_approval_data
+        ).copy(deep=False)
 
     if (
         "end_date" not in approval_data.columns
@@ -179,11 +213,6 @@ def news_visualizations():
     # color map for the candidates
     color_map = {"Donald Trump": "red", "Joe Biden": "blue"}
 
-    # moving average to smooth the data
-    approval_data["smoothed_pct"] = approval_data.groupby("candidate_name")[
-        "pct"
-    ].transform(lambda x: x.rolling(window=30, min_periods=1).mean())
-
     fig = px.line(
         approval_data,
         x="end_date",
@@ -198,22 +227,17 @@ def news_visualizations():
 
     st.markdown("---")
 
-    st.header("3. Stock Price of Apple")
-    stock_data = get_stock_data()
-    fig = px.line(
-        stock_data,
-        x=stock_data.index,
-        y="close",
-        title="Apple Stock Price",
-        labels={"close": "Close Price", "index": "Date"},
-    )
-
-    st.plotly_chart(fig)
+    st.header("3. Market Watchlist")
+    with timed("viz.stocks"):
+        market_panel()
 
     st.markdown("---")
 
     st.header("4. Palestinian Death Toll Over the Last Year")
-    gaza_data = get_palestinian_death_toll_data()
+    with timed("viz.gaza"):
+        gaza_data = cached_call("viz_gaza", get_palestinian_death_toll_data).copy(
+            deep=False
+        )
     gaza_fig = plot_death_toll_data(gaza_data, "Gaza")
     st.plotly_chart(gaza_fig)
 
@@ -0,0 +1,349 @@
+import contextlib
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
+from urllib.parse import urljoin, urlparse
+
+import requests
+import streamlit as st
+from PIL import Image, ImageDraw, ImageOps, features
+
+from metrics import increment, timed
+
+logger = logging.getLogger(__name__)
+
+# default location of the cache; override with the THUMBNAIL_DIR environment variable
+CACHE_DIR = ".cache/thumbnails"
+
+# least recently used thumbnails are deleted once the cache is larger than this
+MAX_CACHE_BYTES = 200 * 1024 * 1024
+
+# width of the images on the home page
+DISPLAY_WIDTH = 700
+QUALITY = 75
+
+# images that take longer than this are shown as a placeholder and finish in the background
+FETCH_TIMEOUT = 3
+MAX_SOURCE_BYTES = 15 * 1024 * 1024
+
+# a download, redirects included, is abandoned after this long
+FETCH_DEADLINE = 10
+MAX_REDIRECTS = 3
+
+# a failed image is not fetched again for this long
+FAILED_RETRY_SECONDS = 600
+
+FETCH_WORKERS = 8
+
+# WebP is about a third smaller than JPEG at the same quality, when Pillow supports it
+FORMAT = "WEBP" if features.check("webp") else "JPEG"
+
+
+def is_public_url(url):
+    """
+    Checks that a URL is http(s) and that its host only resolves to public addresses.
+
+    Image URLs come from third-party articles, so this keeps the server from fetching
+    from itself or the private network it runs in.
+
+    Args:
+        url (str): The URL to check.
+
+    Returns:
+        bool: True if the URL may be fetched.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        return False
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addresses = socket.getaddrinfo(parsed.hostname, port, proto=socket.IPPROTO_TCP)
+    except (OSError, UnicodeError, ValueError):
+        return False
+    return all(
+        ipaddress.ip_address(address[4][0].split("%")[0]).is_global
+        for address in addresses
+    )
+
+
+def download(url, max_bytes=MAX_SOURCE_BYTES, deadline=FETCH_DEADLINE):
+    """
+    Downloads an image, checking the URL and every redirect with is_public_url().
+
+    Args:
+        url (str): The image URL.
+        max_bytes (int): The largest accepted download, in bytes.
+        deadline (float): The time allowed for the whole download, in seconds.
+
+    Returns:
+        bytes: The response body.
+
+    Raises:
+        ValueError: If the URL is not allowed, the response is not a 200 or the body is too large.
+        TimeoutError: If the download takes longer than the deadline.
+    """
+    expires = time.monotonic() + deadline
+    for _ in range(MAX_REDIRECTS + 1):
+        if not is_public_url(url):
+            raise ValueError(f"not a public http(s) URL: {url}")
+        response = requests.get(
+            url, timeout=FETCH_TIMEOUT, stream=True, allow_redirects=False
+        )
+        with contextlib.closing(response):
+            if response.is_redirect:
+                url = urljoin(url, response.headers["Location"])
+                continue
+            if response.status_code != 200:
+                raise ValueError(f"HTTP {response.status_code}")
+            if int(response.headers.get("Content-Length") or 0) > max_bytes:
+                raise ValueError("image too large")
+            chunks = []
+            size = 0
+            # the timeout above only bounds each read, so a slow drip is cut off here
+            for chunk in response.iter_content(64 * 1024):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError("image too large")
+                if time.monotonic() > expires:
+                    raise TimeoutError("image download took too long")
+                chunks.append(chunk)
+            return b"".join(chunks)
+    raise ValueError("too many redirects")
+
+
+def resize_image(data, width=DISPLAY_WIDTH, format=FORMAT):
+    """
+    Scales an image down to the given width and re-encodes it compressed.
+
+    Args:
+        data (bytes): The original image.
+        width (int): The maximum width of the result, in pixels.
+        format (str): "WEBP" or "JPEG".
+
+    Returns:
+        bytes: The encoded thumbnail.
+    """
+    image = Image.open(io.BytesIO(data))
+    # lets the JPEG decoder skip detail we are going to throw away
+    image.draft("RGB", (width, image.height * width // max(image.width, 1)))
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    image = image.convert("RGBA" if has_alpha and format == "WEBP" else "RGB")
+    image.thumbnail((width, width * 4))
+
+    output = io.BytesIO()
+    if format == "WEBP":
+        # method 2 encodes about twice as fast as the default for a slightly larger file
+        image.save(output, "WEBP", quality=QUALITY, method=2)
+    else:
+        image.save(output, "JPEG", quality=QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+@lru_cache(maxsize=1)
+def placeholder():
+    """
+    Returns the image shown in place of an image that failed or is still loading.
+
+    Returns:
+        bytes: The encoded placeholder image.
+    """
+    image = Image.new("RGB", (DISPLAY_WIDTH, DISPLAY_WIDTH * 9 // 16), "#e0e0e0")
+    ImageDraw.Draw(image).text(
+        (DISPLAY_WIDTH // 2, DISPLAY_WIDTH * 9 // 32),
+        "Image unavailable",
+        fill="#757575",
+        anchor="mm",
+    )
+    output = io.BytesIO()
+    image.save(output, FORMAT, quality=QUALITY)
+    return output.getvalue()
+
+
+class ThumbnailCache:
+    """
+    Fetches article images once, resizes them to the display width and keeps them in a
+    size-bounded disk cache keyed by the hash of their URL.
+
+    Fetches run on a shared thread pool, and a URL that is already being fetched (for
+    any session) is not fetched twice. Failed fetches are remembered for a while, so a
+    broken host does not slow down every rerun.
+    """
+
+    def __init__(
+        self, directory=None, max_bytes=MAX_CACHE_BYTES, workers=FETCH_WORKERS
+    ):
+        self.directory = directory or os.environ.get("THUMBNAIL_DIR", CACHE_DIR)
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="thumbnail")
+        self._inflight = {}
+        self._lock = threading.Lock()
+        # temporary files left by an interrupted write are not part of the cache
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".tmp"):
+                os.remove(entry.path)
+        self._size = sum(entry.stat().st_size for entry in os.scandir(self.directory))
+
+    def _paths(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        path = os.path.join(self.directory, key)
+        return key, f"{path}.{FORMAT.lower()}", f"{path}.failed"
+
+    def fetch_many(self, urls, timeout=FETCH_TIMEOUT):
+        """
+        Returns the thumbnails of the given images, fetching the ones that are not cached.
+
+        Images that are not ready within the timeout are returned as a placeholder; their
+        fetch carries on in the background and the next rerun picks them up.
+
+        Args:
+            urls (list): A list of image URLs. Empty entries are skipped.
+            timeout (float): How long to wait for uncached images, in seconds.
+
+        Returns:
+            dict: A dictionary of URL to encoded image.
+        """
+        images = {}
+        futures = {}
+        for url in dict.fromkeys(url for url in urls if url):
+            data = self._cached(url)
+            if data is not None:
+                increment("cache_hits_total", cache="thumbnails")
+                images[url] = data
+            else:
+                increment("cache_misses_total", cache="thumbnails")
+                futures[url] = self._submit(url)
+
+        done, _ = wait(futures.values(), timeout=timeout)
+        for url, future in futures.items():
+            try:
+                data = future.result() if future in done else None
+            except Exception:
+                logger.exception("thumbnail fetch failed for %s", url)
+                data = None
+            if data is None:
+                increment("image_placeholders_total")
+                data = placeholder()
+            images[url] = data
+        return images
+
+    def _cached(self, url):
+        _, path, failed_path = self._paths(url)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            pass
+        else:
+            # mark as recently used; skipped for recent files to save a write per hit. The
+            # file may have been evicted since it was read, which is fine: we have the data
+            now = time.time()
+            with contextlib.suppress(OSError):
+                if now - os.path.getmtime(path) > 3600:
+                    os.utime(path, (now, now))
+            return data
+        try:
+            if time.time() - os.path.getmtime(failed_path) < FAILED_RETRY_SECONDS:
+                return placeholder()
+        except FileNotFoundError:
+            pass
+        return None
+
+    def _submit(self, url):
+        key = self._paths(url)[0]
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._executor.submit(self._fetch, url)
+                self._inflight[key] = future
+                future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return future
+
+    def _fetch(self, url):
+        _, path, failed_path = self._paths(url)
+        try:
+            with timed("images.fetch"):
+                source = download(url)
+                data = resize_image(source)
+        except Exception:
+            with contextlib.suppress(OSError):
+                open(failed_path, "w").close()
+            return None
+        increment("image_bytes_total", len(source), kind="source")
+        increment("image_bytes_total", len(data), kind="thumbnail")
+        try:
+            self._store(path, data)
+        except OSError:
+            # the thumbnail is still shown; it is fetched again on a later page load
+            logger.exception("could not cache the thumbnail of %s", url)
+        return data
+
+    def _store(self, path, data):
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            raise
+        with self._lock:
+            self._size += len(data)
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # delete the least recently used files until the cache is at 90% of its budget
+        entries = []
+        for entry in os.scandir(self.directory):
+            # files being written by other fetches are not in the cache yet
+            if entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        entries.sort()
+        self._size = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._size <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    def clear(self):
+        """
+        Deletes every cached thumbnail and failure record.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".tmp"):
+                    os.remove(entry.path)
+            self._size = 0
+
+
+@st.cache_resource(show_spinner=False)
+def get_thumbnail_cache():
+    """
+    Returns the thumbnail cache shared by every session of this process.
+
+    Returns:
+        ThumbnailCache: The thumbnail cache.
+    """
+    return ThumbnailCache()
@@ -0,0 +1,308 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+import streamlit as st
+
+# sliding window: WINDOW_BUCKETS buckets of BUCKET_SECONDS each (6 hours in total)
+BUCKET_SECONDS = 30 * 60
+WINDOW_BUCKETS = 12
+
+# the newest RECENT_BUCKETS buckets are compared against the rest of the window
+RECENT_BUCKETS = 2
+
+# terms need at least this many recent mentions, and this share of the recent headlines,
+# to count as rising; the app ingests up to 100 top headlines every half hour
+MIN_RECENT_COUNT = 2
+MIN_RECENT_SHARE = 0.03
+
+STOPWORDS = set("""
+    a about after again against all also am an and any are as at be because been before
+    being between both but by can could did do does doing down during each few for from
+    further had has have having he her here hers him his how i if in into is it its just
+    me more most my new news no nor not now of off on once only or other our out over own
+    says said same she should so some such than that the their them then there these they
+    this those through to too under until up very was we were what when where which while
+    who whom why will with would you your week year years today live update updates report
+    """.split())
+
+_WORD = re.compile(r"[A-Za-z][A-Za-z'\-]+")
+_ENTITY = re.compile(r"\b(?:[A-Z][a-zA-Z'\-]+)(?:\s+[A-Z][a-zA-Z'\-]+)+")
+
+
+def extract_terms(headline):
+    """
+    Extracts the terms of a headline: non-stopword words and multi-word capitalised names.
+
+    Args:
+        headline (str): The headline, optionally followed by " - Source Name".
+
+    Returns:
+        set: The distinct terms of the headline, in lower case.
+    """
+    # NewsAPI titles end with " - Source Name"
+    headline = headline.rsplit(" - ", 1)[0]
+    terms = {
+        word.lower()
+        for word in _WORD.findall(headline)
+        if len(word) > 2 and word.lower() not in STOPWORDS
+    }
+    for entity in _ENTITY.findall(headline):
+        words = [word for word in entity.split() if word.lower() not in STOPWORDS]
+        if len(words) > 1:
+            terms.add(" ".join(words).lower())
+    return terms
+
+
+def published_time(article):
+    """
+    Returns the publication time of a NewsAPI article.
+
+    Args:
+        article (dict): A NewsAPI article.
+
+    Returns:
+        float: The publication time in seconds since the epoch, or None if it is missing.
+    """
+    try:
+        published = datetime.strptime(
+            article.get("publishedAt") or "", "%Y-%m-%dT%H:%M:%SZ"
+        )
+    except ValueError:
+        return None
+    return published.replace(tzinfo=timezone.utc).timestamp()
+
+
+def as_query(term):
+    """
+    Formats a term for a NewsAPI query, quoting multi-word names.
+
+    Args:
+        term (str): A term returned by TrendingEngine.rising().
+
+    Returns:
+        str: The term as a NewsAPI query.
+    """
+    return f'"{term}"' if " " in term else term
+
+
+class CountMinSketch:
+    """
+    Fixed-size frequency sketch. Estimates never undercount and overcount by at most
+    a small fraction of the total, independent of the number of distinct terms.
+    """
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _columns(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=4 * self.depth).digest()
+        return [
+            int.from_bytes(digest[4 * row : 4 * row + 4], "little") % self.width
+            for row in range(self.depth)
+        ]
+
+    def add(self, item, count=1):
+        for row, column in zip(self.rows, self._columns(item)):
+            row[column] += count
+
+    def estimate(self, item):
+        return min(row[column] for row, column in zip(self.rows, self._columns(item)))
+
+
+class SpaceSaving:
+    """
+    Keeps the approximate top-k most frequent items of a stream in O(k) memory.
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, item, count=1):
+        if item in self.counts:
+            self.counts[item] += count
+        elif len(self.counts) < self.capacity:
+            self.counts[item] = count
+        else:
+            # replace the smallest item; the newcomer inherits its count as an upper bound
+            smallest = min(self.counts, key=self.counts.get)
+            self.counts[item] = self.counts.pop(smallest) + count
+
+    def items(self):
+        return self.counts.keys()
+
+
+class _Bucket:
+    def __init__(self, start, width, depth, capacity):
+        self.start = start
+        self.sketch = CountMinSketch(width, depth)
+        self.heavy_hitters = SpaceSaving(capacity)
+        self.headlines = 0
+
+
+class TrendingEngine:
+    """
+    Tracks term frequencies over a sliding window of published headlines and ranks the
+    fastest-rising terms.
+
+    The window is a set of time buckets, each with a count-min sketch and a top-k
+    heavy-hitter list, so memory and query time are bounded by the sketch sizes no
+    matter how many headlines are ingested. Headlines are counted in the bucket of their
+    publication time, so how often the app fetches does not change the ranking.
+    """
+
+    def __init__(
+        self,
+        bucket_seconds=BUCKET_SECONDS,
+        window_buckets=WINDOW_BUCKETS,
+        width=2048,
+        depth=4,
+        top_k=64,
+        seen_capacity=20000,
+    ):
+        self.bucket_seconds = bucket_seconds
+        self.window_buckets = window_buckets
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.seen_capacity = seen_capacity
+        self._buckets = {}
+        self._window_start = None
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+        self._ranking = (None, [])
+
+    def _advance(self, now):
+        # drops the buckets that fell out of the window since the last call
+        start = now - now % self.bucket_seconds
+        window_start = start - (self.window_buckets - 1) * self.bucket_seconds
+        if window_start != self._window_start:
+            self._window_start = window_start
+            for bucket_start in [b for b in self._buckets if b < window_start]:
+                del self._buckets[bucket_start]
+            self._version += 1
+        return start
+
+    def ingest(self, articles, now=None):
+        """
+        Adds the headlines of the given articles to the bucket of their publication time.
+
+        Articles that were already ingested (by URL) are skipped, so the same result set
+        can be passed in on every rerun. Articles published before the window are
+        ignored, and articles without a publication time count as published now.
+
+        Args:
+            articles (list): A list of NewsAPI articles.
+            now (float): The current time, in seconds since the epoch.
+
+        Returns:
+            int: The number of new headlines that were ingested.
+        """
+        now = time.time() if now is None else now
+        ingested = 0
+        with self._lock:
+            self._advance(now)
+            for article in articles:
+                key = article.get("url") or article.get("title")
+                title = article.get("title")
+                if not key or not title or key in self._seen:
+                    continue
+                published = published_time(article)
+                published = now if published is None else min(published, now)
+                start = published - published % self.bucket_seconds
+                if start < self._window_start:
+                    continue
+                self._seen[key] = None
+                if len(self._seen) > self.seen_capacity:
+                    self._seen.popitem(last=False)
+                bucket = self._buckets.get(start)
+                if bucket is None:
+                    bucket = _Bucket(start, self.width, self.depth, self.top_k)
+                    self._buckets[start] = bucket
+                for term in extract_terms(title):
+                    bucket.sketch.add(term)
+                    bucket.heavy_hitters.add(term)
+                bucket.headlines += 1
+                ingested += 1
+            if ingested:
+                self._version += 1
+        return ingested
+
+    def rising(self, limit=8, now=None):
+        """
+        Returns the terms whose mention rate grew the most in the recent buckets.
+
+        Args:
+            limit (int): The maximum number of terms to return.
+            now (float): The current time, in seconds since the epoch.
+
+        Returns:
+            list: A list of (term, score) tuples, fastest-rising first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            current_start = self._advance(now)
+            version, ranking = self._ranking
+            if version != self._version:
+                ranking = self._rank(current_start)
+                self._ranking = (self._version, ranking)
+        return ranking[:limit]
+
+    def _rank(self, current_start):
+        buckets = [self._buckets[start] for start in sorted(self._buckets)]
+        recent_start = current_start - (RECENT_BUCKETS - 1) * self.bucket_seconds
+        recent = [bucket for bucket in buckets if bucket.start >= recent_start]
+        baseline = [bucket for bucket in buckets if bucket.start < recent_start]
+        # empty buckets are not stored, so rates are per elapsed bucket, not per stored one
+        baseline_slots = (
+            (recent_start - baseline[0].start) / self.bucket_seconds if baseline else 1
+        )
+
+        candidates = set()
+        for bucket in recent:
+            candidates.update(bucket.heavy_hitters.items())
+        min_count = max(
+            MIN_RECENT_COUNT,
+            MIN_RECENT_SHARE * sum(bucket.headlines for bucket in recent),
+        )
+
+        scored = []
+        for term in candidates:
+            recent_count = sum(bucket.sketch.estimate(term) for bucket in recent)
+            if recent_count < min_count:
+                continue
+            recent_rate = recent_count / RECENT_BUCKETS
+            baseline_rate = (
+                sum(bucket.sketch.estimate(term) for bucket in baseline)
+                / baseline_slots
+            )
+            # growth ratio, weighted by volume so one-off spikes of rare words rank lower
+            score = (recent_rate + 1) / (baseline_rate + 1) * recent_rate**0.5
+            scored.append((term, score))
+
+        scored.sort(key=lambda entry: (-entry[1], -len(entry[0].split()), entry[0]))
+        # drop single words that are part of a higher-ranked name, e.g. "biden" after "joe biden"
+        ranking = []
+        for term, score in scored:
+            if any(term in other.split() for other, _ in ranking):
+                continue
+            ranking.append((term, score))
+        return ranking
+
+
+@st.cache_resource(show_spinner=False)
+def get_trending_engine():
+    """
+    Returns the trending engine shared by every session of this process.
+
+    Returns:
+        TrendingEngine: The trending engine.
+    """
+    return TrendingEngine()
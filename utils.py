@@ -4,6 +4,7 @@ from openai import OpenAI
 from datetime import datetime
 import requests
 from firebase_config import initialize_firebase
+from metrics import timed, increment, record_error
 
 
 db = initialize_firebase()
@@ -12,7 +13,9 @@ db = initialize_firebase()
 NEWS_API_KEY = st.secrets["NEWS_API_KEY"]
 OPENAI_API_KEY = st.secrets["OPENAI_API_KEY"]
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+# an enrichment job must finish within its queue lease (LEASE_SECONDS = 120), or another
+# worker claims it and the request is paid for twice: 3 attempts of at most 30 s each
+client = OpenAI(api_key=OPENAI_API_KEY, timeout=30, max_retries=2)
 
 
 def fetch_news(topics):
@@ -30,8 +33,12 @@ def fetch_news(topics):
         topics = ["general"]
     query = " OR ".join(topics)
     url = f"https://newsapi.org/v2/everything?q={query}&apiKey={NEWS_API_KEY}"
-    response = requests.get(url)
-    return response.json()
+    with timed("news.fetch"):
+        response = requests.get(url)
+        data = response.json()
+    if data.get("status") == "error":
+        record_error("news.fetch")
+    return data
 
 
 def fetch_trending_topics():
@@ -43,11 +50,13 @@ def fetch_trending_topics():
             If the request is successful, the dictionary will contain the trending topics.
             If the request fails, the dictionary will contain an error status, code, and message.
     """
-    url = f"https://newsapi.org/v2/top-headlines?country=us&apiKey={NEWS_API_KEY}&pageSize=10"
-    response = requests.get(url)
+    url = f"https://newsapi.org/v2/top-headlines?country=us&apiKey={NEWS_API_KEY}&pageSize=100"
+    with timed("news.fetch_trending"):
+        response = requests.get(url)
     if response.status_code == 200:
         return response.json()
     else:
+        record_error("news.fetch_trending")
         return {
             "status": "error",
             "code": response.status_code,
@@ -55,6 +64,30 @@ def fetch_trending_topics():
         }
 
 
+def record_token_usage(response):
+    """
+    Adds the token usage of an OpenAI chat completion to the LLM token counters.
+
+    Args:
+        response: The chat completion response returned by the OpenAI client.
+
+    Returns:
+        None
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return
+    increment(
+        "llm_tokens_total", usage.prompt_tokens, model=response.model, kind="prompt"
+    )
+    increment(
+        "llm_tokens_total",
+        usage.completion_tokens,
+        model=response.model,
+        kind="completion",
+    )
+
+
 def get_ai_summary(text):
     """
     Generates an AI summary of the given text using OpenAI's GPT-3.5 Turbo model.
@@ -65,16 +98,18 @@ def get_ai_summary(text):
     Returns:
     str: The generated summary of the text.
     """
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": "You are an expert reader. Summarize the following article to capture all the high level information, in a concise and succint manner.",
-            },
-            {"role": "user", "content": text},
-        ],
-    )
+    with timed("llm.summary"):
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "You are an expert reader. Summarize the following article to capture all the high level information, in a concise and succint manner.",
+                },
+                {"role": "user", "content": text},
+            ],
+        )
+    record_token_usage(response)
     summary = response.choices[0].message.content.strip()
     return summary
 
@@ -89,16 +124,18 @@ def get_sentiment_analysis(text):
     Returns:
         str: The sentiment of the text (Positive, Negative, or Neutral).
     """
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": "Analyze the sentiment of the following text. Only return whether it's Positive, Negative, or Neutral, nothing else.",
-            },
-            {"role": "user", "content": text},
-        ],
-    )
+    with timed("llm.sentiment"):
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Analyze the sentiment of the following text. Only return whether it's Positive, Negative, or Neutral, nothing else.",
+                },
+                {"role": "user", "content": text},
+            ],
+        )
+    record_token_usage(response)
     sentiment = response.choices[0].message.content.strip()
     if sentiment.lower() not in ["positive", "negative", "neutral"]:
         sentiment = "Neutral"
@@ -115,16 +152,18 @@ def get_key_phrases(text):
     Returns:
         str: A string containing the top five key phrases separated by commas.
     """
-    response = client.chat.completions.create(
-        model="gpt-3.5-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": "Extract key phrases from the following text. Return five comma separated key phrases.",
-            },
-            {"role": "user", "content": text},
-        ],
-    )
+    with timed("llm.key_phrases"):
+        response = client.chat.completions.create(
+            model="gpt-3.5-turbo",
+            messages=[
+                {
+                    "role": "system",
+                    "content": "Extract key phrases from the following text. Return five comma separated key phrases.",
+                },
+                {"role": "user", "content": text},
+            ],
+        )
+    record_token_usage(response)
     key_phrases = response.choices[0].message.content.strip().split("\n")
     key_phrases = [phrase.strip() for phrase in key_phrases if phrase.strip()]
 
@@ -132,6 +171,30 @@ def get_key_phrases(text):
     return ", ".join(key_phrases)
 
 
+def get_embedding(text, model="text-embedding-3-small", dimensions=256):
+    """
+    Computes the embedding of the given text using OpenAI's embedding API.
+
+    Args:
+        text (str): The text to embed.
+        model (str): The embedding model.
+        dimensions (int): The length of the returned vector.
+
+    Returns:
+        list: The embedding of the text.
+    """
+    with timed("llm.embedding"):
+        response = client.embeddings.create(
+            model=model, input=text, dimensions=dimensions
+        )
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        increment(
+            "llm_tokens_total", usage.prompt_tokens, model=response.model, kind="prompt"
+        )
+    return response.data[0].embedding
+
+
 def save_article_to_firestore(title, url):
     """
     Saves an article to Firestore if it doesn't already exist.
@@ -146,13 +209,15 @@ def save_article_to_firestore(title, url):
     # check if the article already exists
     articles_ref = db.collection("saved_articles")
     query = articles_ref.where("title", "==", title).where("link", "==", url).limit(1)
-    existing_articles = query.stream()
+    with timed("firestore.find_bookmark"):
+        already_saved = any(query.stream())
 
-    if any(existing_articles):
+    if already_saved:
         return "Article already bookmarked."
 
     doc_ref = db.collection("saved_articles").document()
-    doc_ref.set({"title": title, "link": url, "timestamp": datetime.now()})
+    with timed("firestore.save_bookmark"):
+        doc_ref.set({"title": title, "link": url, "timestamp": datetime.now()})
 
     return "Article bookmarked successfully!"
 
@@ -170,15 +235,15 @@ def fetch_bookmarked_articles():
     articles_ref = db.collection("saved_articles").order_by(
         "timestamp", direction="DESCENDING"
     )
-    articles = articles_ref.stream()
-    return [
-        {
-            "title": article.get("title"),
-            "link": article.get("link"),
-            "timestamp": article.get("timestamp"),
-        }
-        for article in articles
-    ]
+    with timed("firestore.fetch_bookmarks"):
+        return [
+            {
+                "title": article.get("title"),
+                "link": article.get("link"),
+                "timestamp": article.get("timestamp"),
+            }
+            for article in articles_ref.stream()
+        ]
 
 
 def sentiment_box(sentiment):